@@ -0,0 +1,105 @@
+# bench/charts.py — /report chart cost and what it does to the event loop.
+# Renders `n` 30-day charts inline (on the loop, the thing to avoid) and through
+# bot.charts (process pool) while a ticker measures loop lag, then checks that a repeated
+# /report re-sends the cached file_id instead of uploading and that a new check-in or a
+# language switch re-renders, and that renders past CHART_BACKLOG are skipped.
+# Exits 1 if the cache or the backlog cap does not behave.
+# Usage: python bench/charts.py [n]
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_telegram import FakeRequest, message_update  # noqa: E402
+from telegram import Update  # noqa: E402
+
+
+def rows(days: int):
+    rnd = random.Random(days)
+    today = datetime.utcnow().date()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    return [((today - timedelta(days=d)).isoformat(), rnd.uniform(0, 10), rnd.uniform(4, 9))
+            for d in range(days) if rnd.random() < 0.8][::-1], since
+
+
+async def lag(stop: asyncio.Event, worst: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(0.005)
+        worst[0] = max(worst[0], loop.time() - t0 - 0.005)
+
+
+async def timed(label: str, render, n: int):
+    stop, worst = asyncio.Event(), [0.0]
+    ticker = asyncio.create_task(lag(stop, worst))
+    data, since = rows(30)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await render(data, since, 30, ("Stress", "Sleep", "Last 30 days"))
+        await asyncio.sleep(0)  # a real handler returns to the loop between reports
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    print(f"  {label:7}: {elapsed / n * 1e3:6.1f} ms/chart, worst loop stall {worst[0] * 1e3:6.1f} ms")
+
+
+async def inline(*args):
+    return bot.render_chart(*args)
+
+
+async def cache_check() -> bool:
+    sent = []
+    request = FakeRequest(on_send=lambda chat_id, method, params: sent.append((method, params.get("photo"))))
+    app = bot.build_app(request=request)
+    await app.initialize()
+    await app.post_init(app)
+    texts = ["/daily", "5", "no", "7", "walk", "/report", "7", "/report", "7",
+             "/daily", "3", "no", "8", "run", "/report", "7", "lang uk", "/report", "7"]
+    for i, text in enumerate(texts):
+        await app.process_update(Update.de_json(message_update(i + 1, 7, text), app.bot))
+        await asyncio.gather(*bot.chart_tasks)  # the chart follows the text reply in the background
+    await app.shutdown()
+    await app.post_shutdown(app)
+    photos = [p for m, p in sent if m == "sendPhoto"]
+    uploads = [p for p in photos if not (isinstance(p, str) and p.startswith("photo"))]
+    print(f"  cache  : {len(photos)} charts sent, {len(uploads)} uploaded, {len(photos) - len(uploads)} by file_id; "
+          f"hits={bot.charts.hits} misses={bot.charts.misses}")
+    return len(photos) == 4 and len(uploads) == 3 and bot.charts.hits == 1
+
+
+async def backlog_check(n: int) -> bool:
+    # n reports at once against a cap of n // 4: the rest get their text without a chart
+    bot.charts.backlog = max(1, n // 4)
+    data, since = rows(30)
+    pngs = await asyncio.gather(*(bot.charts.render(data, since, 30, ("Stress", "Sleep", "Last 30 days"))
+                                  for _ in range(n)))
+    done = sum(p is not None for p in pngs)
+    print(f"  backlog: {n} at once, cap {bot.charts.backlog}: {done} rendered, {bot.charts.skipped} skipped")
+    bot.charts.backlog = bot.CHART_BACKLOG
+    return done == max(1, n // 4) and bot.charts.skipped == n - done
+
+
+async def main(n: int):
+    bot.charts.open()
+    await asyncio.get_running_loop().run_in_executor(bot.charts.pool, bot._chart_warmup)
+    bot._chart_warmup()
+    await timed("inline", inline, n)
+    await timed("pool", bot.charts.render, n)
+    capped = await backlog_check(n)
+    bot.charts.close()
+    return await cache_check() and capped
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)) else 1)
@@ -0,0 +1,134 @@
+# bench/compact.py — retention/compaction on a multi-year synthetic history.
+# Seeds `years` of check-ins/triggers/plans, then measures /report (aggregate) and insert
+# (save_checkin) latency plus a raw `ts>=?` scan before and after compact() with a one-year
+# horizon; also the worst save_checkin stall while compaction runs. Checks that every removed
+# row is in the archive, that a whole-history report is unchanged (rollups preserved) and
+# that a user's /export still returns every row, archived ones included.
+# Exits 1 if any check fails.
+# `legacy` 1 seeds a file from before auto_vacuum=INCREMENTAL: the first compact() then pays
+# the one full VACUUM that switches it.
+# Usage: python bench/compact.py [users] [years] [legacy]
+
+import asyncio
+import gzip
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+os.environ["RETENTION_DAYS"] = "365"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+WORDS = ["work", "noise", "family", "traffic", "news", "sleep", "pain", "робота", "шум", "новини"]
+
+
+def seed(users: int, years: int, legacy: bool):
+    # oldest first, so ids follow time as they do in production; migrations backfill the rollups
+    conn = sqlite3.connect(bot.DB_PATH)
+    if not legacy:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # as Storage.open creates new files
+    for sql in bot.SCHEMA[:4]:
+        conn.execute(sql)
+    rnd = random.Random(years)
+    now = datetime.utcnow()
+    for d in range(365 * years, -1, -1):
+        day = now - timedelta(days=d)
+        conn.executemany("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
+                         "VALUES (?,?,?,?,?,?)",
+                         [(u, (day + timedelta(seconds=u)).isoformat(), rnd.uniform(0, 10),
+                           " ".join(rnd.sample(WORDS, 2)), rnd.uniform(4, 9), "walk") for u in range(users)])
+        conn.executemany("INSERT INTO triggers (user_id, ts, note) VALUES (?,?,?)",
+                         [(u, day.isoformat(), "loud neighbours") for u in range(0, users, 4)])
+        conn.executemany("INSERT INTO plans (user_id, ts, item) VALUES (?,?,?)",
+                         [(u, day.isoformat(), "call a friend") for u in range(0, users, 8)])
+    conn.commit()
+    conn.close()
+
+
+async def measure(users: int, label: str):
+    rnd = random.Random(0)
+    since = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    t0 = time.perf_counter()
+    for _ in range(200):
+        await bot.aggregate(rnd.randrange(users), 30)
+    report = (time.perf_counter() - t0) / 200 * 1e3
+    t0 = time.perf_counter()
+    for _ in range(20):
+        await bot.db.fetchone("SELECT count(*), avg(stress) FROM checkins WHERE ts>=?", (since,))
+    scan = (time.perf_counter() - t0) / 20 * 1e3
+    t0 = time.perf_counter()
+    for i in range(200):
+        await bot.save_checkin(0, 5.0, "work noise", 7.0, "walk")
+    insert = (time.perf_counter() - t0) / 200 * 1e3
+    size = os.path.getsize(bot.DB_PATH)
+    print(f"  {label:6} db={size / 1e6:7.1f} MB  report={report:.3f}ms  insert={insert:.3f}ms  ts-scan={scan:.1f}ms")
+
+
+async def stall(stop: asyncio.Event, worst: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await bot.save_checkin(0, 5.0, "", 7.0, "walk")
+        worst[0] = max(worst[0], time.perf_counter() - t0)
+        await asyncio.sleep(0.01)
+
+
+async def export_rows(u_id: int) -> list:
+    f, _ = await bot.export_file(u_id, "jsonl")
+    with f, gzip.open(f, "rt") as g:
+        return sorted(g.read().splitlines())
+
+
+async def main(users: int, years: int, legacy: bool):
+    seed(users, years, legacy)
+    t0 = time.perf_counter()
+    await bot.db.open()
+    print(f"users={users} years={years} legacy={legacy}; open+migrate {time.perf_counter() - t0:.1f}s")
+    counts = [(await bot.db.fetchone(f"SELECT count(*) FROM {t}"))[0] for t in bot.EXPORT_SELECT]
+    full = 365 * years + 1
+    history_before = await bot.aggregate(1, full)
+    export_before = await export_rows(1)
+    await measure(users, "before")
+
+    stop, worst = asyncio.Event(), [0.0]
+    probe = asyncio.create_task(stall(stop, worst))
+    t0 = time.perf_counter()
+    result = await bot.compact()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    print(f"  compact {elapsed:.1f}s: archived {result['archived']}, reclaimed {result['reclaimed'] / 1e6:.1f} MB, "
+          f"worst insert stall {worst[0] * 1e3:.1f}ms")
+    await bot.db.maintain("PRAGMA wal_checkpoint(TRUNCATE)")
+    await measure(users, "after")
+
+    left = [(await bot.db.fetchone(f"SELECT count(*) FROM {t}"))[0] for t in bot.EXPORT_SELECT]
+    archived = 0
+    with sqlite3.connect(bot.ARCHIVE_DB) as conn:
+        for (data,) in conn.execute("SELECT data FROM chunks"):
+            archived += len(gzip.decompress(data).splitlines())
+    history_after = await bot.aggregate(1, full)
+    t0 = time.perf_counter()
+    export_after = await export_rows(1)
+    export_s = time.perf_counter() - t0
+    await bot.db.close()
+    moved_ok = archived == sum(result["archived"].values()) and sum(left) >= sum(counts) - archived
+    report_ok = history_before == history_after
+    export_ok = export_before == export_after
+    print(f"  archive holds {archived} rows; rows left {left}; {full}-day report unchanged: {report_ok}")
+    print(f"  user 1 /export: {len(export_before)} rows before, {len(export_after)} after "
+          f"({export_s * 1e3:.0f}ms, archive included), identical: {export_ok}")
+    return moved_ok and report_ok and export_ok
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(0 if asyncio.run(main(int(args[0]) if args else 200, int(args[1]) if len(args) > 1 else 3,
+                                   len(args) > 2 and args[2] == "1")) else 1)
@@ -0,0 +1,143 @@
+# bench/crisis.py — crisis detector: correctness against the old SUICIDE regex, then speed
+# as the phrase list grows (old-style alternation vs the trie regex behind bot.is_crisis).
+# Then the gate end to end through build_app(): new and edited messages, each answered once.
+# Exits 1 if any message the old regex flagged is missed by the new detector, or the gate misfires.
+# Usage: python bench/crisis.py
+
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_telegram import FakeRequest, message_update  # noqa: E402
+from telegram import Update  # noqa: E402
+
+LEGACY = re.compile(
+    r"\b(kill myself|suicide|end it|self[- ]?harm|cut myself|want to die|не хочу жити|суїцид|покінчити|зарізатись|"
+    r"вкоротити|самопошкодження)\b", re.I)
+
+NEUTRAL = [
+    "slept badly again, the neighbours were loud", "work was fine today, a bit tired",
+    "going for a walk with the dog later", "my knee hurts after the run",
+    "сьогодні було багато роботи", "трохи тривожно через новини", "погуляв з дітьми у парку",
+    "не можу зосередитись на книжці", "I'll end it there for today, thanks", "the end item on my list",
+    "itself", "self care day", "суїцидальні думки минули?",
+]
+CRISIS = [
+    "I want to kill myself", "thinking about suicide", "I just want to end it", "self-harm again",
+    "self harm", "selfharm", "I cut myself yesterday", "I want to die", "я не хочу жити",
+    "думаю про суїцид", "хочу покінчити з усім", "хочу зарізатись", "думаю вкоротити собі віку",
+    "самопошкодження знову",
+]
+OBFUSCATE = [
+    lambda s: s.upper(),
+    lambda s: s.replace("-", "‑").replace(" ", "  "),
+    lambda s: s.replace("о", "o").replace("е", "e").replace("а", "a"),  # latin homoglyphs
+    lambda s: s.replace("ї", "і"),
+    lambda s: s.replace(" ", " ​"),
+    lambda s: s.replace("self harm", "self—harm"),
+]
+
+
+def corpus(n: int, rnd: random.Random):
+    out = []
+    for _ in range(n):
+        base = rnd.choice(NEUTRAL + CRISIS)
+        text = " ".join(rnd.sample(NEUTRAL, 2) + [base])
+        if rnd.random() < 0.3:
+            text = rnd.choice(OBFUSCATE)(text)
+        out.append(text)
+    return out
+
+
+def correctness(messages) -> int:
+    missed = [m for m in messages if LEGACY.search(m) and not bot.is_crisis(m)]
+    extra = [m for m in messages if bot.is_crisis(m) and not LEGACY.search(m)]
+    flagged = sum(bool(LEGACY.search(m)) for m in messages)
+    print(f"correctness: {len(messages)} messages, old regex flags {flagged}, "
+          f"missed by new {len(missed)}, newly caught (normalization) {len(extra)}")
+    for m in missed[:10]:
+        print("  MISSED:", repr(m))
+    return len(missed)
+
+
+def synthetic_phrases(n: int, rnd: random.Random):
+    vocab = ["dark", "alone", "gone", "never", "wake", "pills", "bridge", "rope", "tired", "nobody",
+             "темно", "сам", "зникнути", "ніколи", "таблетки", "міст", "втомився", "нікому", "прокинутись"]
+    phrases = set(bot.CRISIS_PHRASES)
+    while len(phrases) < n:
+        phrases.add(" ".join(rnd.sample(vocab, rnd.choice((2, 3)))))
+    return sorted(phrases)
+
+
+def per_message_us(fn, messages, reps: int = 3) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        for m in messages:
+            fn(m)
+    return (time.perf_counter() - t0) / (reps * len(messages)) * 1e6
+
+
+async def gate() -> int:
+    # (kind, text, crisis replies expected): an edit that introduces a phrase is caught like a
+    # new message, and a harmless edit is neither answered nor fed back into a conversation
+    cases = [("new", "I want to kill myself", 1), ("edited", "I want to kill myself", 1),
+             ("edited", "слово за словом: не хочу жити", 1), ("edited", "I feel tense today", 0)]
+    replies, errors = Counter(), []
+    request = FakeRequest(on_send=lambda chat_id, method, params: replies.update(
+        [(chat_id, params.get("text") == bot.T("en", "crisis"))]))
+    with tempfile.TemporaryDirectory() as d:
+        bot.db = bot.Storage(os.path.join(d, "crisis.sqlite3"))
+        app = bot.build_app(request=request)
+
+        async def on_error(update, context):
+            errors.append(context.error)
+
+        app.add_error_handler(on_error)
+        await app.initialize()
+        await app.post_init(app)
+        for u_id, (kind, text, _) in enumerate(cases, 1):
+            await app.process_update(Update.de_json(message_update(u_id, u_id, text, edited=kind == "edited"), app.bot))
+        await app.shutdown()
+        await app.post_shutdown(app)
+    bad = 0
+    for u_id, (kind, text, want) in enumerate(cases, 1):
+        got, other = replies[(u_id, True)], replies[(u_id, False)]
+        ok = got == want and not other
+        bad += not ok
+        print(f"gate: {kind:6s} {text!r}: crisis replies {got}, other replies {other}{'' if ok else '  FAIL'}")
+    for e in errors:
+        print("  ERROR:", repr(e))
+    return bad + len(errors)
+
+
+def main():
+    rnd = random.Random(7)
+    missed = correctness(corpus(20000, rnd) + NEUTRAL + CRISIS)
+    missed += asyncio.run(gate())
+    for length in (100, 1000, 4000):
+        messages = []
+        for m in corpus(300, rnd):
+            while len(m) < length:
+                m += " " + rnd.choice(NEUTRAL)
+            messages.append(m[:length])
+        for n in (len(bot.CRISIS_PHRASES), 100, 300, 1000):
+            phrases = synthetic_phrases(n, rnd)
+            naive = re.compile(r"\b(" + "|".join(re.escape(p) for p in phrases) + r")\b", re.I)
+            trie = bot.compile_phrases(phrases)
+            old = per_message_us(naive.search, messages)
+            new = per_message_us(lambda m: trie.search(bot.normalize(m)), messages)
+            print(f"{length:5d} chars, {n:5d} phrases: alternation {old:8.1f}us  trie+normalize {new:7.1f}us")
+    sys.exit(1 if missed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench/export.py — /export memory and its effect on everyone else.
+# Seeds a history, then runs the admin bulk export in CSV and JSONL while a probe keeps
+# calling get_user-style reads; reports peak Python heap during the export (tracemalloc),
+# output size and probe latency with and without the export running.
+# Usage: python bench/export.py [rows]
+
+import asyncio
+import gzip
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+
+def seed(rows: int, users: int = 1000):
+    conn = sqlite3.connect(bot.DB_PATH)
+    for sql in bot.SCHEMA:
+        conn.execute(sql)
+    rnd = random.Random(1)
+    now = datetime.utcnow()
+    conn.executemany("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) VALUES (?,?,?,?,?,?)",
+                     ((rnd.randrange(users), (now - timedelta(minutes=i)).isoformat(), rnd.uniform(0, 10),
+                       "work noise family", rnd.uniform(4, 9), "walk after lunch") for i in range(rows)))
+    conn.executemany("INSERT INTO triggers (user_id, ts, note) VALUES (?,?,?)",
+                     ((rnd.randrange(users), now.isoformat(), "loud neighbours again") for _ in range(rows // 4)))
+    conn.executemany("INSERT INTO plans (user_id, ts, item) VALUES (?,?,?)",
+                     ((rnd.randrange(users), now.isoformat(), "call a friend") for _ in range(rows // 4)))
+    conn.commit()
+    conn.close()
+
+
+async def probe(stop: asyncio.Event, lat: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await bot.db.fetchone("SELECT lang FROM users WHERE user_id=?", (1,))
+        lat.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.001)
+
+
+def p(lat, q):
+    return sorted(lat)[int(len(lat) * q) - 1] * 1e3 if lat else 0.0
+
+
+async def main(rows: int):
+    seed(rows)
+    await bot.db.open()
+    idle, stop = [], asyncio.Event()
+    task = asyncio.create_task(probe(stop, idle))
+    await asyncio.sleep(1)
+    stop.set()
+    await task
+    print(f"rows={rows + rows // 2}  probe idle: p50={p(idle, .5):.2f}ms p99={p(idle, .99):.2f}ms")
+    for fmt in ("csv", "jsonl"):
+        busy, stop = [], asyncio.Event()
+        task = asyncio.create_task(probe(stop, busy))
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        f, n = await bot.export_file(None, fmt)
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stop.set()
+        await task
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(0)
+            lines = sum(1 for _ in gzip.GzipFile(fileobj=f))
+        assert lines == n + (fmt == "csv"), (lines, n)
+        print(f"  {fmt:5}: {n} rows in {elapsed:.2f}s ({n / elapsed:,.0f} rows/s), {size / 1e6:.1f} MB gz, "
+              f"peak heap {peak / 1e6:.1f} MB; probe p50={p(busy, .5):.2f}ms p99={p(busy, .99):.2f}ms")
+    await bot.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
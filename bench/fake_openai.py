@@ -0,0 +1,106 @@
+# bench/fake_openai.py — local stub of POST /v1/chat/completions for offline benchmarks.
+# `delay` is time to first token; each further token takes `token_delay`. Requests with
+# "stream": true get SSE chunks, others get one JSON body after the whole generation time.
+# Runs its own event loop in a background thread so it keeps answering even when the
+# caller blocks its loop. Point the bot at it with OPENAI_BASE_URL=<server.url>.
+
+import asyncio
+import json
+import threading
+import time
+
+REPLY = "Try slow breathing: inhale 4, hold 4, exhale 4, hold 4. Then name 5 things you can see."
+
+
+class FakeOpenAI:
+    def __init__(self, delay: float = 0.2, reply: str = REPLY, token_delay: float = 0.0):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests = 0
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._conns = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop).result()
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self._server.close()
+        for task in list(self._conns):
+            task.cancel()
+        await asyncio.gather(*self._conns, return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._conns.add(task)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    k, _, v = line.partition(":")
+                    if k.strip().lower() == "content-length":
+                        length = int(v)
+                body = json.loads(await reader.readexactly(length) or b"{}")
+                self.requests += 1
+                await asyncio.sleep(self.delay)
+                if body.get("stream"):
+                    await self._stream(writer)
+                else:
+                    await asyncio.sleep(self.token_delay * len(self._tokens()))
+                    await self._respond(writer, body)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._conns.discard(task)
+            writer.close()
+
+    def _completion(self) -> dict:
+        return {
+            "id": f"chatcmpl-{self.requests}", "object": "chat.completion", "created": int(time.time()),
+            "model": "fake", "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": self.reply}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    async def _respond(self, writer: asyncio.StreamWriter, body: dict):
+        data = json.dumps(self._completion()).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: " + str(len(data)).encode() + b"\r\n\r\n" + data)
+        await writer.drain()
+
+    def _tokens(self) -> list:
+        words = self.reply.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    async def _stream(self, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        def send(payload: str):
+            data = f"data: {payload}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        for i, tok in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            send(json.dumps({
+                "id": f"chatcmpl-{self.requests}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": "fake", "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}],
+            }))
+            await writer.drain()
+        send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,133 @@
+# bench/fake_telegram.py — in-process stand-in for the Bot API, for bot.build_app(request=...).
+# Every call is answered locally with a plausible result and recorded, so handlers run
+# end to end without network. `latency` adds a fake round trip to each call.
+# FakeBotAPI serves the same answers over HTTP (BOT_API_URL=<server.url>) for bots running
+# in other processes.
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Svitlo", "username": "svitlo_bot"}
+
+
+class FakeRequest(BaseRequest):
+    def __init__(self, latency: float = 0.0, on_send=None):
+        self.latency = latency
+        self.on_send = on_send  # callback(chat_id, method, params) for every outgoing message
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        return {"message_id": int(params.get("message_id") or next(self._ids)), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, **extra}
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendDocument":
+            return self._message(params, document={"file_id": f"doc{next(self._ids)}", "file_unique_id": "d"})
+        if method == "sendPhoto":
+            fid = f"photo{next(self._ids)}"
+            return self._message(params, photo=[{"file_id": fid, "file_unique_id": fid, "width": 1, "height": 1}])
+        return True
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self.result(name, params)
+        if self.on_send and isinstance(result, dict) and "message_id" in result:
+            self.on_send(result["chat"]["id"], name, params)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def message_update(update_id: int, user_id: int, text: str, edited: bool = False) -> dict:
+    # edited=True: the user edited an earlier message (message_id = update_id) to read `text`
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    message = {
+        "message_id": update_id, "date": int(time.time()), "text": text, "entities": entities,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+    }
+    if edited:
+        return {"update_id": update_id, "edited_message": {**message, "edit_date": int(time.time())}}
+    return {"update_id": update_id, "message": message}
+
+
+class FakeBotAPI:
+    # HTTP flavour of FakeRequest, on its own loop in a background thread; on_send is called
+    # from that thread
+    def __init__(self, latency: float = 0.0, on_send=None):
+        self.fake = FakeRequest(latency=latency, on_send=on_send)
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._conns = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop).result()
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self._server.close()
+        for task in list(self._conns):
+            task.cancel()
+        await asyncio.gather(*self._conns, return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._conns.add(task)
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                headers = {k.strip().lower(): v.strip() for k, _, v in (h.partition(":") for h in head[1:] if h)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                ctype = headers.get("content-type", "")
+                if ctype.startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                elif ctype.startswith("application/x-www-form-urlencoded"):
+                    params = dict(parse_qsl(body.decode()))
+                else:
+                    params = {}  # multipart uploads: the answer does not depend on them
+                status, data = await self.fake.do_request(head[0].split()[1], "POST", _Params(params))
+                writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._conns.discard(task)
+            writer.close()
+
+
+class _Params:
+    def __init__(self, parameters: dict):
+        self.parameters = parameters
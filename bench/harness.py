@@ -0,0 +1,182 @@
+# bench/harness.py — offline load test: bot.build_app() against a fake Bot API and a temp DB.
+# Replays a scripted multi-user session and reports per-handler p50/p95/p99 latency,
+# updates/sec, DB statement counts and Bot API calls as JSON, so runs can be diffed
+# between commits. --burst K replaces the session with K free-form lines per user, typed
+# --gap seconds apart, to exercise chat coalescing and quotas (compare CHAT_DEBOUNCE=0).
+# "replies" is per user: first update sent -> last bot message, i.e. time to the answer.
+# "llm_tokens" are the bot's own estimates (count_tokens) per completion call actually sent,
+# summaries included; with CHAT_DEBOUNCE=0 a long --burst is a long conversation.
+# /report charts are off (CHART_WORKERS=0): they go out after the text reply, in the
+# background, and bench/charts.py measures them. Set CHART_WORKERS=1 to include them anyway.
+# Usage: python bench/harness.py [--users 1,100,10000] [--llm] [--burst 3 --gap 0.2] [--out results.json]
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ.setdefault("CHART_WORKERS", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_telegram import FakeRequest, message_update  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import ConversationHandler  # noqa: E402
+
+SESSION = [
+    "/daily", "6", "work noise", "6.5", "walk",
+    "/ground", "a", "b", "c", "d", "e", "f",
+    "/plan", "walk", "call mom", "done",
+    "/triggers", "sirens at night", "done",
+    "/report", "30",
+    "I feel tense today",
+]
+
+BURST = ["I feel tense today", "can't focus at work", "and I slept badly", "what should I do?", "anything quick?"]
+
+
+def percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def instrument(app, timings):
+    def timed(name, callback):
+        async def wrapper(update, context):
+            t0 = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                timings[name].append(time.perf_counter() - t0)
+        return wrapper
+
+    def walk(handlers):
+        for h in handlers:
+            if isinstance(h, ConversationHandler):
+                walk(h.entry_points)
+                for state_handlers in h.states.values():
+                    walk(state_handlers)
+                walk(h.fallbacks)
+            else:
+                h.callback = timed(h.callback.__name__, h.callback)
+
+    for group in app.handlers.values():
+        walk(group)
+
+
+def count_db(db, counts):
+    fetchone, fetchall, write = db.fetchone, db.fetchall, db.write
+
+    async def c_fetchone(sql, params=()):
+        counts["select"] += 1
+        return await fetchone(sql, params)
+
+    async def c_fetchall(sql, params=()):
+        counts["select"] += 1
+        return await fetchall(sql, params)
+
+    async def c_write(*stmts):
+        counts["write_calls"] += 1
+        counts["write_stmts"] += len(stmts)
+        return await write(*stmts)
+
+    db.fetchone, db.fetchall, db.write = c_fetchone, c_fetchall, c_write
+
+
+async def run(users: int, script=SESSION, llm_url: str = None, workdir: str = None, gap: float = 0.0) -> dict:
+    bot.db = bot.Storage(os.path.join(workdir, f"harness-{users}.sqlite3"))
+    bot.profiles = bot.ProfileCache()
+    bot.llm = bot.LLM()
+    bot.quota = bot.ChatQuota()
+    started, answered = {}, {}
+    request = FakeRequest(on_send=lambda chat_id, method, params: answered.__setitem__(chat_id, time.perf_counter()))
+    app = bot.build_app(request=request)
+    timings, db_counts = defaultdict(list), Counter()
+    instrument(app, timings)
+    await app.initialize()
+    await app.post_init(app)
+    if llm_url:
+        await bot.llm.open(api_key="fake", base_url=llm_url)
+    await app.start()
+    count_db(bot.db, db_counts)
+    request.calls.clear()
+
+    async def user(u_id: int):
+        started[u_id] = time.perf_counter()
+        for i, text in enumerate(script):
+            if i and gap:
+                await asyncio.sleep(gap)
+            await app.process_update(Update.de_json(message_update(u_id * 100 + i, u_id, text), app.bot))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(1, users + 1)))
+    while bot.bursts.tasks or bot.chart_tasks:  # coalesced chat answers and charts finish in the background
+        await asyncio.gather(*bot.bursts.tasks, *bot.chart_tasks)
+    elapsed = time.perf_counter() - t0
+    await app.stop()
+    await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+
+    handlers = {}
+    for name, values in sorted(timings.items()):
+        values.sort()
+        handlers[name] = {"n": len(values), "p50_ms": round(percentile(values, 0.5) * 1e3, 3),
+                          "p95_ms": round(percentile(values, 0.95) * 1e3, 3),
+                          "p99_ms": round(percentile(values, 0.99) * 1e3, 3)}
+    updates = users * len(script)
+    replies = sorted(answered[u] - started[u] for u in started if u in answered)
+    sent = sum(v for k, v in bot.llm.stats.items() if k != "shed")
+    return {
+        "users": users, "updates": updates, "seconds": round(elapsed, 3),
+        "updates_per_s": round(updates / elapsed, 1),
+        "handlers": handlers,
+        "replies": {"n": len(replies), "p50_ms": round(percentile(replies, 0.5) * 1e3, 1),
+                    "p99_ms": round(percentile(replies, 0.99) * 1e3, 1)} if replies else {},
+        "db": {**db_counts, "statements_per_update": round(
+            (db_counts["select"] + db_counts["write_stmts"]) / updates, 3)},
+        "bot_api": dict(request.calls),
+        "llm": dict(bot.llm.stats),
+        "llm_tokens": {"prompt_per_call": round(bot.llm.tokens["prompt"] / sent, 1),
+                       "prompt_max": bot.llm.max_prompt,
+                       "completion_per_call": round(bot.llm.tokens["completion"] / sent, 1)} if sent else {},
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", default="1,100,10000")
+    ap.add_argument("--llm", action="store_true", help="answer free-form chat from a local fake endpoint")
+    ap.add_argument("--burst", type=int, default=0, help="K free-form lines per user instead of the session")
+    ap.add_argument("--gap", type=float, default=0.2, help="seconds between burst lines")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    script = (BURST * args.burst)[:args.burst] if args.burst else SESSION
+    results = {"commit": commit(), "session": script, "runs": []}
+    with tempfile.TemporaryDirectory() as d, FakeOpenAI(delay=0.05) as fake:
+        for n in (int(x) for x in args.users.split(",")):
+            results["runs"].append(asyncio.run(run(n, script, llm_url=fake.url if args.llm else None, workdir=d,
+                                                   gap=args.gap if args.burst else 0.0)))
+    out = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# bench/llm.py — chat fallback under concurrent users against a local fake completions endpoint.
+# "before" replays the old path: a new sync OpenAI client per message, called on the event loop.
+# "after" goes through bot.LLM (one AsyncOpenAI client, semaphore, timeout, bounded queue).
+# Usage: python bench/llm.py [users] [delay_s]
+
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": bot.SYSTEM_PROMPT}, {"role": "user", "content": "I can't calm down"}]
+
+
+async def legacy(url: str, users: int) -> float:
+    from openai import OpenAI
+
+    async def one():
+        client = OpenAI(api_key="fake", base_url=url)
+        client.chat.completions.create(model="fake", messages=MESSAGES, max_tokens=300)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(users)))
+    return time.perf_counter() - t0
+
+
+async def pooled(url: str, users: int, **kw):
+    llm = bot.LLM(**kw)
+    await llm.open(api_key="fake", base_url=url)
+    t0 = time.perf_counter()
+    answers = await asyncio.gather(*(llm.complete(MESSAGES) for _ in range(users)))
+    dt = time.perf_counter() - t0
+    await llm.close()
+    return dt, sum(a is not None for a in answers), dict(llm.stats)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    with FakeOpenAI(delay=delay) as fake:
+        before = asyncio.run(legacy(fake.url, users))
+        print(f"{users} users, {delay}s completions")
+        print(f"before (sync client per message): {before:6.2f}s wall")
+        dt, ok, stats = asyncio.run(pooled(fake.url, users))
+        print(f"after  (pooled AsyncOpenAI):      {dt:6.2f}s wall, answered {ok}/{users}, {stats}")
+        dt, ok, stats = asyncio.run(pooled(fake.url, users * 10, concurrency=4, queue=8, timeout=delay * 3))
+        print(f"overload x10 (4 in flight, queue 8): {dt:5.2f}s wall, answered {ok}/{users * 10}, {stats}")
+
+
+if __name__ == "__main__":
+    main()
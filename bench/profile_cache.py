@@ -0,0 +1,75 @@
+# bench/profile_cache.py — /daily handler latency with and without the profile cache.
+# Usage: python bench/profile_cache.py [users]
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+    async def reply_text(self, *args, **kwargs):
+        return None
+
+
+def fake_update(u_id: int, text: str):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=u_id), message=FakeMessage(text))
+
+
+DAILY = [(bot.daily, "/daily"), (bot.daily_stress, "6"), (bot.daily_triggers, "work noise"),
+         (bot.daily_sleep, "6.5"), (bot.daily_goal, "walk")]
+
+
+async def run(path: str, users: int, cache_size: int):
+    bot.db = bot.Storage(path)
+    bot.profiles = bot.ProfileCache(size=cache_size)
+    await bot.db.open()
+    queries = 0
+    fetchone = bot.db.fetchone
+
+    async def counted(sql, params=()):
+        nonlocal queries
+        queries += 1
+        return await fetchone(sql, params)
+
+    bot.db.fetchone = counted
+    lat = []
+    for u_id in range(users):
+        ctx = SimpleNamespace(user_data={})
+        for handler, text in DAILY:
+            t0 = time.perf_counter()
+            await handler(fake_update(u_id, text), ctx)
+            lat.append(time.perf_counter() - t0)
+    await bot.db.close()
+    lat.sort()
+    return {
+        "mean_us": statistics.fmean(lat) * 1e6,
+        "p95_us": lat[int(len(lat) * 0.95)] * 1e6,
+        "profile_queries_per_flow": queries / users,
+        **bot.profiles.stats(),
+    }
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as d:
+        for name, size in (("no cache", 0), ("cache", bot.PROFILE_CACHE_SIZE)):
+            r = asyncio.run(run(os.path.join(d, f"{size}.sqlite3"), users, size))
+            print(f"{name:9s} mean {r['mean_us']:7.0f}us  p95 {r['p95_us']:7.0f}us  "
+                  f"profile queries/flow {r['profile_queries_per_flow']:.1f}  "
+                  f"hits {r['hits']} misses {r['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench/report.py — /report latency as check-in history grows.
+# "before" is the old aggregate(): scan checkins by ts and average in Python.
+# "after" reads daily_rollups; the DB is migrated (index + backfill) by Storage.open().
+# Usage: python bench/report.py [users]
+
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+WORDS = ["work", "noise", "family", "traffic", "news", "sleep", "pain", "робота", "шум", "новини"]
+
+
+def build_legacy(path: str, users: int, years: int, per_day: int = 2):
+    conn = sqlite3.connect(path)
+    for sql in bot.SCHEMA[:4]:  # baseline tables only, no rollups or index
+        conn.execute(sql)
+    now = datetime.utcnow()
+    rnd = random.Random(years)
+    rows = []
+    for d in range(365 * years):
+        day = now - timedelta(days=d)
+        for u_id in range(users):
+            for k in range(per_day):
+                rows.append((u_id, (day - timedelta(minutes=k)).isoformat(), rnd.uniform(0, 10),
+                             " ".join(rnd.sample(WORDS, 2)), rnd.uniform(4, 9), "walk"))
+    conn.executemany("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
+                     "VALUES (?,?,?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def legacy_aggregate(cur, u_id: int, days: int):
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    rows = cur.execute("SELECT stress, sleep_hours, triggers FROM checkins WHERE user_id=? AND ts>=?",
+                       (u_id, since)).fetchall()
+    stresses = [r[0] for r in rows if r[0] is not None]
+    sleeps = [r[1] for r in rows if r[1] is not None]
+    words = bot.re.findall(r"[A-Za-zА-Яа-яЇїІіЄєҐґ']{3,}", " ".join([(r[2] or "") for r in rows]).lower())
+    Counter(words).most_common(5)
+    return sum(stresses) / len(stresses), sum(sleeps) / len(sleeps)
+
+
+def timed(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e3
+
+
+async def rollup_ms(path: str, users: int, reps: int) -> float:
+    bot.db = bot.Storage(path)
+    await bot.db.open()
+    t0 = time.perf_counter()
+    for i in range(reps):
+        await bot.aggregate(i % users, 30)
+    dt = (time.perf_counter() - t0) / reps * 1e3
+    await bot.db.close()
+    return dt
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    reps = 50
+    with tempfile.TemporaryDirectory() as d:
+        for years in (1, 3, 5):
+            path = os.path.join(d, f"{years}y.sqlite3")
+            total = build_legacy(path, users, years)
+            conn = sqlite3.connect(path)
+            cur = conn.cursor()
+            before = timed(lambda: legacy_aggregate(cur, 1, 30), reps)
+            conn.close()
+            after = asyncio.run(rollup_ms(path, users, reps))
+            print(f"{years}y history ({total:7d} check-ins): /report 30 before {before:7.2f}ms  after {after:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/restart.py — restart-resume check for SqlitePersistence plus its per-message cost.
+# Starts /daily on one Application, stops it mid-flow (as a redeploy would), finishes the
+# flow on a fresh Application over the same DB and checks the check-in was saved. Then stops
+# right after a chat line was buffered for coalescing and checks it is still answered.
+# Exits 1 if the flow does not resume or the buffered line is dropped.
+# Usage: python bench/restart.py [users]
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_telegram import FakeRequest, message_update  # noqa: E402
+from telegram import Update  # noqa: E402
+
+
+async def session(texts, user_id: int = 7, llm_url: str = None):
+    replies = []
+    app = bot.build_app(request=FakeRequest(on_send=lambda chat_id, method, params: replies.append(params["text"])))
+    await app.initialize()
+    await app.post_init(app)
+    if llm_url:
+        await bot.llm.open(api_key="fake", base_url=llm_url)
+    await app.start()
+    for i, text in enumerate(texts):
+        await app.process_update(Update.de_json(message_update(i + 1, user_id, text), app.bot))
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+    return replies
+
+
+async def resume() -> bool:
+    await session(["/daily", "6", "work noise"])
+    replies = await session(["6.5", "walk"])
+    await bot.db.open()
+    row = await bot.db.fetchone("SELECT stress, triggers, sleep_hours, micro_goal FROM checkins WHERE user_id=7")
+    await bot.db.close()
+    ok = replies == [bot.T("en", "checkin_sleep_saved"), bot.T("en", "checkin_done")] and \
+        row == (6.0, "work noise", 6.5, "walk")
+    print(f"restart-resume: {'ok' if ok else 'FAILED'} replies={replies} row={row}")
+    return ok
+
+
+async def drain() -> bool:
+    # the line is still inside its CHAT_DEBOUNCE window when the redeploy begins
+    bot.LLM_STREAM = False
+    with FakeOpenAI(delay=0.2) as fake:
+        replies = await session(["I feel tense today"], user_id=8, llm_url=fake.url)
+    ok = len(replies) == 1 and replies[0] != bot.T("en", "unknown")
+    print(f"redeploy with a buffered chat line: {'ok' if ok else 'FAILED'} replies={replies}")
+    return ok
+
+
+async def cost(users: int, interval: float) -> float:
+    bot.PERSIST_INTERVAL = interval
+    app = bot.build_app(request=FakeRequest())
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    updates = [Update.de_json(message_update(u * 10 + i, u, t), app.bot)
+               for u in range(1000, 1000 + users) for i, t in enumerate(["/ground", "a", "b", "c", "d", "e", "f"])]
+    t0 = time.perf_counter()
+    for upd in updates:
+        await app.process_update(upd)
+    dt = (time.perf_counter() - t0) / len(updates)
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    return dt * 1e6
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    ok = asyncio.run(resume())
+    ok = asyncio.run(drain()) and ok
+    off = asyncio.run(cost(users, 0))
+    on = asyncio.run(cost(users, bot.PERSIST_INTERVAL or 10))
+    print(f"/ground x{users} users: {off:6.0f}us/update without persistence, {on:6.0f}us/update with")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench/storage.py — updates/sec of the storage layer, before vs after.
+# "before" replays the old pattern: sync sqlite3 on the event loop, one commit per write.
+# "after" goes through bot.Storage (aiosqlite, WAL, batched writer).
+# Usage: python bench/storage.py [updates] [users]
+
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+
+async def legacy(path: str, updates: int, users: int) -> float:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    cur = conn.cursor()
+    for sql in bot.SCHEMA:
+        cur.execute(sql)
+    conn.commit()
+
+    async def update(i: int):
+        u_id = i % users
+        row = cur.execute("SELECT user_id, lang, country FROM users WHERE user_id=?", (u_id,)).fetchone()
+        if not row:
+            cur.execute("INSERT INTO users (user_id, lang, country, created_at) VALUES (?,?,?,?)",
+                        (u_id, "en", "US", datetime.utcnow().isoformat()))
+            conn.commit()
+        cur.execute("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
+                    "VALUES (?,?,?,?,?,?)", (u_id, datetime.utcnow().isoformat(), 5, "work", 7, "walk"))
+        conn.commit()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(update(i) for i in range(updates)))
+    dt = time.perf_counter() - t0
+    conn.close()
+    return updates / dt
+
+
+async def current(path: str, updates: int, users: int) -> float:
+    bot.db = bot.Storage(path)
+    await bot.db.open()
+
+    async def update(i: int):
+        u = await bot.get_user(i % users)
+        await bot.save_checkin(u["user_id"], 5, "work", 7, "walk")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(update(i) for i in range(updates)))
+    dt = time.perf_counter() - t0
+    await bot.db.close()
+    return updates / dt
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as d:
+        before = asyncio.run(legacy(os.path.join(d, "legacy.sqlite3"), updates, users))
+        after = asyncio.run(current(os.path.join(d, "async.sqlite3"), updates, users))
+    print(f"updates={updates} users={users}")
+    print(f"before (sync sqlite3, commit per write): {before:8.0f} updates/s")
+    print(f"after  (aiosqlite, WAL, batched writer): {after:8.0f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench/stream.py — time to first visible text for chat(), blocking vs streaming replies.
+# Drives bot.answer() (chat() after coalescing) with fake Telegram messages against
+# bench/fake_openai.py.
+# Usage: python bench/stream.py [users] [first_token_s] [per_token_s]
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+
+
+class SentMessage:
+    def __init__(self, owner, text: str):
+        self.owner = owner
+        self.owner.seen(text)
+
+    async def edit_text(self, text: str, **kwargs):
+        self.owner.edits += 1
+        self.owner.seen(text)
+        return self
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.t0 = time.perf_counter()
+        self.first_text = None
+        self.done = None
+        self.edits = 0
+
+    def seen(self, text: str):
+        now = time.perf_counter() - self.t0
+        if text != "…" and self.first_text is None:
+            self.first_text = now
+        self.done = now
+
+    async def reply_text(self, text: str, **kwargs):
+        return SentMessage(self, text)
+
+
+async def run(url: str, users: int, stream: bool):
+    bot.LLM_STREAM = stream
+    bot.profiles = bot.ProfileCache()
+    for u_id in range(users):  # profile lookups are not what we measure here
+        bot.profiles.put(u_id, {"user_id": u_id, "lang": "en", "country": "US"})
+    bot.quota = bot.ChatQuota(global_rate=users)  # nor are quotas
+    bot.llm = bot.LLM()
+    await bot.db.open()
+    await bot.llm.open(api_key="fake", base_url=url)
+    msgs = [FakeMessage("I keep replaying the day") for _ in range(users)]
+    await asyncio.gather(*(bot.answer(SimpleNamespace(effective_user=SimpleNamespace(id=i), message=m), m.text)
+                           for i, m in enumerate(msgs)))
+    await bot.llm.close()
+    await bot.db.close()
+    first = sorted(m.first_text for m in msgs)
+    return statistics.median(first), first[int(len(first) * 0.95)], statistics.median(m.done for m in msgs), \
+        statistics.fmean(m.edits for m in msgs)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    first_token = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    per_token = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    with FakeOpenAI(delay=first_token, token_delay=per_token) as fake:
+        for name, stream in (("blocking", False), ("streaming", True)):
+            p50, p95, done, edits = asyncio.run(run(fake.url, users, stream))
+            print(f"{name:9s} first visible text p50 {p50 * 1e3:6.0f}ms p95 {p95 * 1e3:6.0f}ms  "
+                  f"complete p50 {done * 1e3:6.0f}ms  edits/reply {edits:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench/triggers.py — top-5 triggers for a user with thousands of trigger entries.
+# "before" is the old approach: join every trigger string in the window, re.findall, fresh Counter.
+# "after" sums the trigger_terms index (populated here by the Storage.open() backfill).
+# Usage: python bench/triggers.py [entries...]
+
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+WORDS = ["work", "noise", "family", "traffic", "news", "crowds", "pain", "fireworks",
+         "робота", "шум", "новини", "сирени", "черги", "родина", "біль", "натовп"]
+
+
+def build(path: str, entries: int):
+    conn = sqlite3.connect(path)
+    for sql in bot.SCHEMA[:4]:
+        conn.execute(sql)
+    now = datetime.utcnow()
+    rnd = random.Random(entries)
+    rows = [(1, (now - timedelta(minutes=i * 43200 // entries)).isoformat(), 5, " ".join(rnd.sample(WORDS, 4)),
+             7, "walk") for i in range(entries)]
+    conn.executemany("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
+                     "VALUES (?,?,?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def legacy_top(cur) -> str:
+    since = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    rows = cur.execute("SELECT triggers FROM checkins WHERE user_id=? AND ts>=?", (1, since)).fetchall()
+    words = bot.re.findall(r"[A-Za-zА-Яа-яЇїІіЄєҐґ']{3,}", " ".join([(r[0] or "") for r in rows]).lower())
+    return ", ".join([w for w, _ in Counter(words).most_common(5)])
+
+
+async def indexed_ms(path: str, reps: int) -> float:
+    bot.db = bot.Storage(path)
+    await bot.db.open()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        await bot.aggregate(1, 30)
+    dt = (time.perf_counter() - t0) / reps * 1e3
+    await bot.db.close()
+    return dt
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 5000, 20000]
+    reps = 50
+    with tempfile.TemporaryDirectory() as d:
+        for n in sizes:
+            path = os.path.join(d, f"{n}.sqlite3")
+            build(path, n)
+            cur = sqlite3.connect(path).cursor()
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                legacy_top(cur)
+            before = (time.perf_counter() - t0) / reps * 1e3
+            after = asyncio.run(indexed_ms(path, reps))
+            print(f"{n:6d} trigger entries in 30d: top-5 before {before:7.2f}ms  after (whole report) {after:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
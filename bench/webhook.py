@@ -0,0 +1,97 @@
+# bench/webhook.py — load test for BOT_MODE=webhook: posts synthetic update JSON to a local
+# webhook and times each update from POST until the bot's reply leaves (fake Bot API).
+# Every user sends a whole /daily flow back to back, so replies also check per-user ordering.
+# Usage: python bench/webhook.py [users] [concurrent_updates] [bot_api_latency_s]
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+
+import json
+
+tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+os.environ["DB_PATH"] = os.path.join(tmp.name, "bench.sqlite3")
+if len(sys.argv) > 2:
+    os.environ["CONCURRENT_UPDATES"] = sys.argv[2]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+from fake_telegram import FakeRequest, message_update  # noqa: E402
+
+FLOW = ["/daily", "6", "work noise", "6.5", "walk"]
+EXPECT = ["checkin_intro", "checkin_stress_saved", "checkin_triggers_saved", "checkin_sleep_saved", "checkin_done"]
+PORT = 18080
+
+
+async def request(method: str, path: str, payload: dict = None, conn=None):
+    # minimal HTTP/1.1 client; a pooled client library costs more than the bot under test
+    reader, writer = conn or await asyncio.open_connection("127.0.0.1", PORT)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    length = next((int(h.split(":", 1)[1]) for h in head if h.lower().startswith("content-length:")), 0)
+    data = await reader.readexactly(length)
+    if conn is None:
+        writer.close()
+    return int(head[0].split()[1]), data
+
+
+async def main(users: int, latency: float):
+    sent = defaultdict(deque)   # chat_id -> POST timestamps awaiting a reply
+    replies = defaultdict(int)
+    latencies, out_of_order = [], 0
+    done = asyncio.Event()
+    total = users * len(FLOW)
+
+    def on_send(chat_id, method, params):
+        nonlocal out_of_order
+        step = replies[chat_id]
+        replies[chat_id] += 1
+        if not params.get("text", "").startswith(bot.T("en", EXPECT[step])[:8]):
+            out_of_order += 1
+        latencies.append(time.perf_counter() - sent[chat_id].popleft())
+        if len(latencies) == total:
+            done.set()
+
+    app = bot.build_app(request=FakeRequest(latency=latency, on_send=on_send))
+    stop = asyncio.Event()
+    server = asyncio.create_task(bot.run_webhook(app, port=PORT, url="", stop=stop))
+    for _ in range(100):
+        try:
+            status, _ = await request("GET", "/healthz")
+            if status == 200:
+                break
+        except OSError:
+            pass
+        await asyncio.sleep(0.05)
+
+    async def user(u_id: int):
+        # one keep-alive connection per user, like Telegram's webhook delivery
+        conn = await asyncio.open_connection("127.0.0.1", PORT)
+        for i, text in enumerate(FLOW):
+            sent[u_id].append(time.perf_counter())
+            await request("POST", bot.WEBHOOK_PATH, message_update(u_id * 10 + i, u_id, text), conn)
+        conn[1].close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(1, users + 1)))
+    await asyncio.wait_for(done.wait(), 120)
+    dt = time.perf_counter() - t0
+    health = json.loads((await request("GET", "/healthz"))[1])
+    stop.set()
+    await server
+    latencies.sort()
+    print(f"users={users} updates={total} concurrent_updates={bot.CONCURRENT_UPDATES} bot_api_latency={latency}s")
+    print(f"throughput {total / dt:7.0f} updates/s  p50 {latencies[len(latencies) // 2] * 1e3:6.1f}ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:6.1f}ms  out-of-order replies {out_of_order}  "
+          f"health {health}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+                     float(sys.argv[3]) if len(sys.argv) > 3 else 0.05))
@@ -0,0 +1,140 @@
+# bench/workers.py — throughput of `python bot.py` in webhook mode, single process vs the
+# WORKERS=N supervisor (front + N workers sharded by user_id), against FakeBotAPI.
+# Each user posts a whole /daily flow back to back; replies are checked for per-user order.
+# After the timed round, a second round is posted and SIGTERM sent as soon as every POST is
+# acknowledged: every acknowledged update must still get its reply (graceful drain).
+# With workers, the front's /metrics must carry every worker's handler metrics.
+# Exits 1 on lost or out-of-order replies or missing worker metrics.
+# Usage: python bench/workers.py [users] [workers list, e.g. 1,2,4]
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+
+import bot  # noqa: E402
+from fake_telegram import FakeBotAPI, message_update  # noqa: E402
+
+FLOW = ["/daily", "6", "work noise", "6.5", "walk"]
+EXPECT = [bot.T("en", k)[:8] for k in
+          ("checkin_intro", "checkin_stress_saved", "checkin_triggers_saved", "checkin_sleep_saved", "checkin_done")]
+BOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot.py")
+
+
+async def post(port: int, payload: dict, conn) -> int:
+    reader, writer = conn
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {bot.WEBHOOK_PATH} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    length = next((int(h.split(":", 1)[1]) for h in head if h.lower().startswith("content-length:")), 0)
+    await reader.readexactly(length)
+    return int(head[0].split()[1])
+
+
+async def healthy(port: int, timeout: float = 90):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /healthz HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            line = await reader.readline()
+            writer.close()
+            if b" 200 " in line:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot did not come up")
+
+
+async def scrape(port: int) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    data = await reader.read()
+    writer.close()
+    return data.split(b"\r\n\r\n", 1)[1].decode()
+
+
+async def round_(port: int, users: int, base: int, replies: dict, expected: int, got: threading.Event) -> float:
+    async def user(u_id: int):
+        conn = await asyncio.open_connection("127.0.0.1", port)
+        for i, text in enumerate(FLOW):
+            assert await post(port, message_update(base + u_id * 10 + i, u_id, text), conn) == 200
+        conn[1].close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(1, users + 1)))
+    return time.perf_counter() - t0
+
+
+async def run(users: int, workers: int, port: int) -> bool:
+    replies, lock = defaultdict(list), threading.Lock()
+    counted, got = [0], threading.Event()
+    target = [users * len(FLOW)]
+
+    def on_send(chat_id, method, params):
+        with lock:
+            replies[chat_id].append(params.get("text", ""))
+            counted[0] += 1
+            if counted[0] >= target[0]:
+                got.set()
+
+    with tempfile.TemporaryDirectory() as d, FakeBotAPI(on_send=on_send) as api:
+        env = {**os.environ, "BOT_MODE": "webhook", "WORKERS": str(workers), "PORT": str(port),
+               "WORKER_PORT": str(port + 1), "BOT_API_URL": api.url, "DB_PATH": os.path.join(d, "bench.sqlite3"),
+               "WEBHOOK_URL": "", "RENDER_EXTERNAL_URL": "", "CHART_WORKERS": "0", "OPENAI_API_KEY": ""}
+        proc = subprocess.Popen([sys.executable, BOT], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            t0 = time.perf_counter()
+            await healthy(port)
+            startup = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            await round_(port, users, 0, replies, target[0], got)
+            await asyncio.to_thread(got.wait, 120)
+            elapsed = time.perf_counter() - t0
+            ordered = sum(1 for texts in replies.values()
+                          if [t[:8] for t in texts] == EXPECT)
+            page = await scrape(port)
+            seen = sum(f'svitlo_handler_seconds_count{{worker="{i}",' in page for i in range(workers))
+
+            got.clear()
+            target[0] *= 2
+            await round_(port, users, 100000, replies, target[0], got)
+            t0 = time.perf_counter()
+            proc.send_signal(signal.SIGTERM)
+            await asyncio.to_thread(proc.wait, 60)
+            drain = time.perf_counter() - t0
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+    total = users * len(FLOW)
+    lost = 2 * total - counted[0]
+    label = "single" if workers == 1 else f"{workers} workers"
+    metrics_ok = workers == 1 or seen == workers
+    print(f"  {label:10}: {total / elapsed:6.0f} updates/s  startup {startup:4.1f}s  in-order users {ordered}/{users}  "
+          f"drain {drain:4.1f}s, lost after ack {lost}" + ("" if workers == 1 else f", /metrics workers {seen}/{workers}"))
+    return ordered == users and lost == 0 and metrics_ok
+
+
+async def main(users: int, sizes: list):
+    print(f"users={users} updates/round={users * len(FLOW)} cpus={os.cpu_count()}")
+    ok = True
+    for k, n in enumerate(sizes):
+        ok &= await run(users, n, 18200 + k * 20)
+    return ok
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sizes = [int(x) for x in (args[1] if len(args) > 1 else "1,2,4").split(",")]
+    sys.exit(0 if asyncio.run(main(int(args[0]) if args else 200, sizes)) else 1)
@@ -2,25 +2,110 @@
 # Svitlo AI — Telegram MVP (one-file)
 # NOT medical/diagnostic service. Crisis-safe fallback.
 
+import asyncio
+import contextlib
+import csv
+import functools
+import glob
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import multiprocessing
 import os
 import re
+import signal
 import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+import aiosqlite
+import tornado.httpclient
+import tornado.web
+
 from telegram import (
-    Update, InlineKeyboardMarkup, InlineKeyboardButton
+    Bot, Update, InlineKeyboardMarkup, InlineKeyboardButton
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 from telegram.ext import (
-    ApplicationBuilder, Application, CommandHandler, MessageHandler,
-    ConversationHandler, CallbackQueryHandler, ContextTypes, filters
+    ApplicationBuilder, Application, ApplicationHandlerStop, BasePersistence, BaseUpdateProcessor, CommandHandler,
+    MessageHandler, ConversationHandler, CallbackQueryHandler, ContextTypes, PersistenceInput, filters
 )
+from telegram.request import BaseRequest
 
 # ---------- ENV ----------
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en").strip().lower()
 DEFAULT_COUNTRY = os.getenv("DEFAULT_COUNTRY", "US").strip().upper()
+DB_PATH = os.getenv("DB_PATH", "").strip() or os.path.join(os.path.dirname(os.path.abspath(__file__)), "svitlo.sqlite3")
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_BATCH = int(os.getenv("DB_BATCH", "256"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))  # 0 = off
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "3600"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip() or None
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))   # in-flight completions
+LLM_QUEUE = int(os.getenv("LLM_QUEUE", "32"))               # waiters beyond that are shed
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))         # seconds, queue wait included
+LLM_STREAM = os.getenv("LLM_STREAM", "1").strip() == "1"     # progressive edits vs one reply
+LLM_EDIT_INTERVAL = float(os.getenv("LLM_EDIT_INTERVAL", "1.0"))  # min seconds between edits
+CHAT_DEBOUNCE = float(os.getenv("CHAT_DEBOUNCE", "1.5"))  # quiet seconds that close a burst, 0 = off
+CHAT_DEBOUNCE_MAX = float(os.getenv("CHAT_DEBOUNCE_MAX", "4"))  # longest a burst is held
+CHAT_USER_RATE = float(os.getenv("CHAT_USER_RATE", "6"))  # completions per user per minute
+CHAT_USER_BURST = float(os.getenv("CHAT_USER_BURST", "3"))
+CHAT_GLOBAL_RATE = float(os.getenv("CHAT_GLOBAL_RATE", "20"))  # completions per second, all users
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "8"))  # messages kept verbatim, older ones summarized
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "1500"))  # prompt tokens per completion (estimated)
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+CHAT_DIGEST = os.getenv("CHAT_DIGEST", "1").strip() == "1"  # add a 7-day check-in digest to the prompt
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "1"))  # processes rendering /report charts, 0 = no charts
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "10000"))
+CHART_BACKLOG = int(os.getenv("CHART_BACKLOG", "32"))  # renders waiting on the pool before /report skips the chart
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()  # polling | webhook
+WEBHOOK_URL = (os.getenv("WEBHOOK_URL", "").strip() or os.getenv("RENDER_EXTERNAL_URL", "").strip()).rstrip("/")
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+if WEBHOOK_SECRET and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+    # Telegram's secret_token allows only these; Render's generateValue is base64 (+/=)
+    WEBHOOK_SECRET = hashlib.sha256(WEBHOOK_SECRET.encode()).hexdigest()
+PORT = int(os.getenv("PORT", "8080"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))  # 1 = strictly sequential
+WORKERS = int(os.getenv("WORKERS", "1"))  # >1 with BOT_MODE=webhook: front + N worker processes by user_id
+WORKER_PORT = int(os.getenv("WORKER_PORT", str(PORT + 1)))  # workers listen on 127.0.0.1:WORKER_PORT+i
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "-1"))  # set by the supervisor, -1 = single process
+SHARDS = WORKERS if WORKER_INDEX >= 0 else 1
+LEADER = WORKER_INDEX <= 0  # runs reminders, broadcasts and compaction
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))  # seconds a worker gets to finish on redeploy
+BOT_API_URL = os.getenv("BOT_API_URL", "").strip().rstrip("/")  # self-hosted Bot API server, if any
+PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", "10"))  # seconds between state flushes, 0 = off
+CRISIS_PHRASES_FILE = os.getenv("CRISIS_PHRASES_FILE", "").strip()  # extra phrases, one per line
+ADMINS = {int(x) for x in os.getenv("ADMINS", "").replace(",", " ").split() if x.isdigit()}
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # msg/s for broadcasts + reminders (Telegram ~30)
+REMIND_INTERVAL = float(os.getenv("REMIND_INTERVAL", "60"))  # seconds between reminder scans
+EXPORT_PAGE = int(os.getenv("EXPORT_PAGE", "1000"))  # rows per fetch while streaming /export
+EXPORT_MAX_BYTES = 50 * 1024 * 1024  # Bot API upload limit
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))  # archive history older than this, 0 = keep all
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "").strip() or os.path.join(os.path.dirname(DB_PATH), "archive")
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "86400"))  # seconds between compactions
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", "2000"))  # rows archived per slice
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "256"))  # pages released per incremental_vacuum step
+METRICS_ENABLED = os.getenv("METRICS", "1").strip() == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # polling mode: serve /metrics here (0 = don't)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()  # optional bearer token for /metrics
+
+log = logging.getLogger("svitlo")
 
 if not BOT_TOKEN:
     raise SystemExit("ERROR: TELEGRAM_BOT_TOKEN is not set.")
@@ -29,7 +114,7 @@ if not BOT_TOKEN:
 TEXT = {
     "en": {
         "start": "Hi! I'm *Svitlo AI* — mental health training (not a medical service).\n"
-                 "Commands: /daily /breath /ground /sleep /plan /triggers /report /settings",
+                 "Commands: /daily /breath /ground /sleep /plan /triggers /report /export /remind /settings",
         "choose_lang": "Choose language / Оберіть мову",
         "saved": "Saved ✅",
         "unknown": "Try /daily or /breath.",
@@ -52,10 +137,23 @@ TEXT = {
         "settings": "Settings. Lang={lang}, Country={country}. Send `lang en/uk` or `country US/UA`.",
         "crisis": "If you’re thinking about self-harm: US 988/911, UA 7333/112. I can’t help here.",
         "ok": "OK.",
+        "reminder": "Time for your /daily check-in 🌿",
+        "remind_usage": "Send `/remind HH:MM` (UTC) for a daily check-in reminder, or `/remind off`.",
+        "remind_set": "Reminder set for {hhmm} UTC.",
+        "remind_off": "Reminder off.",
+        "export_ready": "Your history: {n} records.",
+        "export_empty": "Nothing to export yet.",
+        "export_running": "Your export is still being prepared.",
+        "export_too_big": "The export is over 50 MB, too big to send here.",
+        "chart_stress": "Stress (0–10)",
+        "chart_sleep": "Sleep, h",
+        "chart_title": "Last {days} days",
+        "slow_down": "Let’s slow down a little — give me a moment before the next message.",
+        "busy": "I’m getting a lot of messages right now. Try again in a minute, or use /breath meanwhile.",
     },
     "uk": {
         "start": "Привіт! Я *Svitlo AI* — тренування психстійкості (не медична служба).\n"
-                 "Команди: /daily /breath /ground /sleep /plan /triggers /report /settings",
+                 "Команди: /daily /breath /ground /sleep /plan /triggers /report /export /remind /settings",
         "choose_lang": "Choose language / Оберіть мову",
         "saved": "Збережено ✅",
         "unknown": "Спробуй /daily або /breath.",
@@ -78,23 +176,108 @@ TEXT = {
         "settings": "Налаштування. Мова={lang}, Країна={country}. Надішли `lang en/uk` або `country US/UA`.",
         "crisis": "Якщо думаєш про самопошкодження: US 988/911, UA 7333/112. Я не можу допомогти тут.",
         "ok": "Ок.",
+        "reminder": "Час для щоденного чек-іну /daily 🌿",
+        "remind_usage": "Надішли `/remind ГГ:ХХ` (UTC) для щоденного нагадування або `/remind off`.",
+        "remind_set": "Нагадування на {hhmm} UTC.",
+        "remind_off": "Нагадування вимкнено.",
+        "export_ready": "Твоя історія: {n} записів.",
+        "export_empty": "Поки що нічого експортувати.",
+        "export_running": "Твій експорт ще готується.",
+        "export_too_big": "Експорт більший за 50 МБ, надіслати його тут не вийде.",
+        "chart_stress": "Стрес (0–10)",
+        "chart_sleep": "Сон, год",
+        "chart_title": "Останні {days} днів",
+        "slow_down": "Повільніше, будь ласка — дай мені хвилинку перед наступним повідомленням.",
+        "busy": "Зараз дуже багато повідомлень. Спробуй за хвилину, а поки що — /breath.",
     }
 }
 
 def T(lang: str, key: str) -> str:
     return TEXT.get(lang, TEXT["en"]).get(key, key)
 
-# ---------- DB (sqlite, один файл) ----------
-DB_PATH = os.path.join(os.path.dirname(__file__), "svitlo.sqlite3")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
-cur.execute("""CREATE TABLE IF NOT EXISTS users (
+# ---------- METRICS ----------
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metrics:
+    # Counters and fixed-bucket histograms in plain dicts, rendered in Prometheus text
+    # format on scrape. Recording is a couple of dict operations; off means no-op.
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.counters = Counter()   # (name, labels) -> value
+        self.hists = {}             # (name, labels) -> per-bucket counts + [sum, count]
+        self.collectors = []        # callables yielding (name, type, labels, value) at scrape time
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        if self.enabled:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        if not self.enabled:
+            return
+        h = self.hists.get((name, labels))
+        if h is None:
+            h = self.hists[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        h[bisect_left(BUCKETS, value)] += 1
+        h[-2] += value
+        h[-1] += 1
+
+    def timed(self, name: str, labels: tuple = ()):
+        def deco(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - t0, labels)
+            return wrapper
+        return deco
+
+    def render(self) -> str:
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        lines, typed = [], set()
+        samples = [(n, "counter", lb, v) for (n, lb), v in self.counters.items()]
+        for collect in self.collectors:
+            samples += list(collect())
+        for name, kind, labels, value in sorted(samples, key=lambda s: (s[0], s[2])):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), h in sorted(self.hists.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            acc = 0
+            for le, n in zip(BUCKETS + ("+Inf",), h):
+                acc += n
+                lines.append(f"{name}_bucket{fmt(labels + (('le', le),))} {acc}")
+            lines.append(f"{name}_sum{fmt(labels)} {h[-2]}")
+            lines.append(f"{name}_count{fmt(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+async def watch_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("svitlo_event_loop_lag_seconds", max(0.0, loop.time() - t0 - interval))
+
+# ---------- DB (aiosqlite, WAL, один writer) ----------
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS users (
   user_id INTEGER PRIMARY KEY,
   lang TEXT,
   country TEXT,
   created_at TEXT
-)""")
-cur.execute("""CREATE TABLE IF NOT EXISTS checkins (
+)""",
+    """CREATE TABLE IF NOT EXISTS checkins (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER,
   ts TEXT,
@@ -102,83 +285,1244 @@ cur.execute("""CREATE TABLE IF NOT EXISTS checkins (
   triggers TEXT,
   sleep_hours REAL,
   micro_goal TEXT
-)""")
-cur.execute("""CREATE TABLE IF NOT EXISTS triggers (
+)""",
+    """CREATE TABLE IF NOT EXISTS triggers (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER,
   ts TEXT,
   note TEXT
-)""")
-cur.execute("""CREATE TABLE IF NOT EXISTS plans (
+)""",
+    """CREATE TABLE IF NOT EXISTS plans (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER,
   ts TEXT,
   item TEXT
-)""")
-conn.commit()
+)""",
+    """CREATE TABLE IF NOT EXISTS daily_rollups (
+  user_id INTEGER,
+  day TEXT,
+  n INTEGER,
+  stress_sum REAL,
+  stress_n INTEGER,
+  sleep_sum REAL,
+  sleep_n INTEGER,
+  PRIMARY KEY (user_id, day)
+) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_checkins_user_ts ON checkins (user_id, ts)",
+    """CREATE TABLE IF NOT EXISTS user_state (
+  user_id INTEGER PRIMARY KEY,
+  data TEXT
+)""",
+    """CREATE TABLE IF NOT EXISTS conv_state (
+  name TEXT,
+  key TEXT,
+  state TEXT,
+  PRIMARY KEY (name, key)
+) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS chat_memory (
+  user_id INTEGER PRIMARY KEY,
+  summary TEXT,
+  turns TEXT
+)""",
+    """CREATE TABLE IF NOT EXISTS broadcasts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  text TEXT,
+  created_at TEXT,
+  cursor INTEGER,
+  sent INTEGER,
+  failed INTEGER,
+  done_at TEXT
+)""",
+    """CREATE TABLE IF NOT EXISTS trigger_terms (
+  user_id INTEGER,
+  day TEXT,
+  term TEXT,
+  n INTEGER,
+  PRIMARY KEY (user_id, day, term)
+) WITHOUT ROWID""",
+]
+
+# shared by writes, backfill and anything else that needs trigger terms
+TERM = re.compile(r"[A-Za-zА-Яа-яЇїІіЄєҐґ']{3,}")
+
+def tokenize(text: str):
+    return TERM.findall((text or "").lower())
+
+TERM_UPSERT = ("INSERT INTO trigger_terms (user_id, day, term, n) VALUES (?,?,?,?) "
+               "ON CONFLICT (user_id, day, term) DO UPDATE SET n=n+excluded.n")
+
+def term_stmts(u_id: int, day: str, text: str):
+    return [(TERM_UPSERT, (u_id, day, w, c)) for w, c in Counter(tokenize(text)).items()]
+
+async def _backfill_terms(conn):
+    counts = Counter()
+    for sql in ("SELECT user_id, substr(ts, 1, 10), triggers FROM checkins",
+                "SELECT user_id, substr(ts, 1, 10), note FROM triggers"):
+        async with conn.execute(sql) as q:
+            async for u_id, day, text in q:
+                for w in tokenize(text):
+                    counts[(u_id, day, w)] += 1
+    await conn.executemany(TERM_UPSERT, [(u, d, w, c) for (u, d, w), c in counts.items()])
+
+# one-off data migrations, applied in order; PRAGMA user_version = how many ran
+MIGRATIONS = [
+    # 1: backfill daily_rollups from existing check-ins
+    """INSERT OR REPLACE INTO daily_rollups (user_id, day, n, stress_sum, stress_n, sleep_sum, sleep_n)
+SELECT user_id, substr(ts, 1, 10), count(*), total(stress), count(stress), total(sleep_hours), count(sleep_hours)
+FROM checkins GROUP BY user_id, substr(ts, 1, 10)""",
+    # 2: trigger term frequencies from check-ins and /triggers notes
+    _backfill_terms,
+    # 3-5: daily reminders (HH:MM UTC) and the day the last one went out
+    "ALTER TABLE users ADD COLUMN remind_at TEXT",
+    "ALTER TABLE users ADD COLUMN reminded_on TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_users_remind ON users (remind_at)",
+    # 6: was a full VACUUM into auto_vacuum=INCREMENTAL at startup; compact() switches on first use
+    "SELECT 1",
+]
+
+class Storage:
+    # One writer connection fed by a queue: everything queued during a tick goes
+    # into a single transaction (one fsync). Reads go through a small pool of
+    # read-only connections, which WAL lets run alongside the writer.
+    def __init__(self, path: str, readers: int = DB_READERS, batch: int = DB_BATCH):
+        self.path = path
+        self.readers = readers
+        self.batch = batch
+        self._writer = None
+        self._pool = None
+        self._queue = None
+        self._task = None
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def open(self):
+        if self._writer is not None:
+            return
+        self._writer = await aiosqlite.connect(self.path)
+        await self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")  # takes effect on a new file only
+        await self._writer.execute("PRAGMA journal_mode=WAL")
+        await self._writer.execute("PRAGMA synchronous=NORMAL")
+        for sql in SCHEMA:
+            await self._writer.execute(sql)
+        async with self._writer.execute("PRAGMA user_version") as q:
+            version = (await q.fetchone())[0]
+        for i, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            if isinstance(step, str):
+                await self._writer.execute(step)
+            else:
+                await step(self._writer)
+            await self._writer.execute(f"PRAGMA user_version={i}")
+        await self._writer.commit()
+        self._pool = asyncio.Queue()
+        for _ in range(self.readers):
+            c = await aiosqlite.connect(self.path)
+            await c.execute("PRAGMA query_only=ON")
+            self._pool.put_nowait(c)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._task:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+        while self._pool and not self._pool.empty():
+            await self._pool.get_nowait().close()
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
+
+    async def write(self, *stmts):
+        # stmts: (sql, params) pairs applied atomically; resolves to the first lastrowid after commit
+        if not self.alive:
+            raise RuntimeError("storage is not open")
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((stmts, fut))
+        return await fut
 
-def get_user(u_id: int):
-    row = cur.execute("SELECT user_id, lang, country FROM users WHERE user_id=?", (u_id,)).fetchone()
+    @metrics.timed("svitlo_db_seconds", (("op", "fetchone"),))
+    async def fetchone(self, sql: str, params=()):
+        c = await self._pool.get()
+        try:
+            async with c.execute(sql, params) as q:
+                return await q.fetchone()
+        finally:
+            self._pool.put_nowait(c)
+
+    @metrics.timed("svitlo_db_seconds", (("op", "fetchall"),))
+    async def fetchall(self, sql: str, params=()):
+        c = await self._pool.get()
+        try:
+            async with c.execute(sql, params) as q:
+                return await q.fetchall()
+        finally:
+            self._pool.put_nowait(c)
+
+    async def stream(self, sql: str, params=(), size: int = EXPORT_PAGE, head=()):
+        # pages of rows from one cursor on a connection of its own, so a long export neither
+        # holds a pooled reader nor sees rows committed after it started (WAL snapshot).
+        # `head` queries run first in the same read transaction; each yields all its rows as a page.
+        c = await aiosqlite.connect(self.path)
+        try:
+            await c.execute("PRAGMA query_only=ON")
+            if head:
+                await c.execute("BEGIN")
+                for h in head:
+                    async with c.execute(h) as q:
+                        yield await q.fetchall()
+            async with c.execute(sql, params) as q:
+                while rows := await q.fetchmany(size):
+                    yield rows
+        finally:
+            await c.close()
+
+    async def maintain(self, script: str):
+        # PRAGMA steps (incremental_vacuum, optimize, ...) on the writer, between write batches.
+        # executescript because execute() steps incremental_vacuum only once (one page).
+        if not self.alive:
+            raise RuntimeError("storage is not open")
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((script, fut))
+        return await fut
+
+    async def _write_loop(self):
+        stop = False
+        held = None
+        while not stop:
+            item, held = held or await self._queue.get(), None
+            if item is None:
+                break
+            if isinstance(item[0], str):
+                await self._script(*item)
+                continue
+            batch = [item]
+            while len(batch) < self.batch and not self._queue.empty():
+                nxt = self._queue.get_nowait()
+                if nxt is None:
+                    stop = True
+                    break
+                if isinstance(nxt[0], str):
+                    held = nxt
+                    break
+                batch.append(nxt)
+            await self._commit(batch)
+
+    async def _script(self, script: str, fut):
+        t0 = time.perf_counter()
+        try:
+            await self._writer.executescript(script)
+        except Exception as e:
+            log.warning("maintenance failed: %s", e)
+            fut.set_exception(e)
+        else:
+            fut.set_result(None)
+        finally:
+            metrics.observe("svitlo_db_seconds", time.perf_counter() - t0, (("op", "maintain"),))
+
+    async def _apply(self, stmts):
+        rowid = None
+        for sql, params in stmts:
+            c = await self._writer.execute(sql, params)
+            if rowid is None:
+                rowid = c.lastrowid
+        return rowid
+
+    async def _commit(self, batch):
+        t0 = time.perf_counter()
+        try:
+            await self._commit_batch(batch)
+        finally:
+            metrics.observe("svitlo_db_seconds", time.perf_counter() - t0, (("op", "commit"),))
+            metrics.inc("svitlo_db_write_batches_total")
+            metrics.inc("svitlo_db_writes_total", value=len(batch))
+
+    async def _commit_batch(self, batch):
+        try:
+            results = [await self._apply(stmts) for stmts, _ in batch]
+            await self._writer.commit()
+        except Exception:
+            await self._writer.rollback()
+            # one bad write must not sink the rest of the tick: retry one by one
+            for stmts, fut in batch:
+                try:
+                    res = await self._apply(stmts)
+                    await self._writer.commit()
+                except Exception as e:
+                    await self._writer.rollback()
+                    log.warning("write failed: %s", e)
+                    metrics.inc("svitlo_errors_total", (("where", "db"),))
+                    if not fut.done():
+                        fut.set_exception(e)
+                else:
+                    if not fut.done():
+                        fut.set_result(res)
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+db = Storage(DB_PATH)
+
+class ProfileCache:
+    # LRU + TTL in front of the users table; set_lang/set_country write through.
+    def __init__(self, size: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, u_id: int):
+        item = self._data.get(u_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[u_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(u_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, u_id: int, profile: dict):
+        if self.size <= 0:
+            return
+        self._data[u_id] = (time.monotonic() + self.ttl, profile)
+        self._data.move_to_end(u_id)
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def update(self, u_id: int, **fields):
+        item = self._data.get(u_id)
+        if item is not None:
+            item[1].update(fields)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+profiles = ProfileCache()
+metrics.collectors.append(lambda: [
+    ("svitlo_profile_cache_hits_total", "counter", (), profiles.hits),
+    ("svitlo_profile_cache_misses_total", "counter", (), profiles.misses),
+    ("svitlo_profile_cache_size", "gauge", (), len(profiles._data)),
+])
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "get_user"),))
+async def get_user(u_id: int):
+    u = profiles.get(u_id)
+    if u is not None:
+        return u
+    row = await db.fetchone("SELECT user_id, lang, country FROM users WHERE user_id=?", (u_id,))
     if row:
-        return {"user_id": row[0], "lang": row[1], "country": row[2]}
-    cur.execute("INSERT INTO users (user_id, lang, country, created_at) VALUES (?,?,?,?)",
-                (u_id, DEFAULT_LANG, DEFAULT_COUNTRY, datetime.utcnow().isoformat()))
-    conn.commit()
-    return {"user_id": u_id, "lang": DEFAULT_LANG, "country": DEFAULT_COUNTRY}
-
-def set_lang(u_id: int, lang: str):
-    cur.execute("UPDATE users SET lang=? WHERE user_id=?", (lang, u_id)); conn.commit()
-
-def set_country(u_id: int, country: str):
-    cur.execute("UPDATE users SET country=? WHERE user_id=?", (country, u_id)); conn.commit()
-
-def save_checkin(u_id: int, stress, triggers, sleep_hours, micro_goal):
-    cur.execute("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
-                "VALUES (?,?,?,?,?,?)",
-                (u_id, datetime.utcnow().isoformat(), stress, triggers, sleep_hours, micro_goal))
-    conn.commit()
-
-def save_trigger(u_id: int, note: str):
-    cur.execute("INSERT INTO triggers (user_id, ts, note) VALUES (?,?,?)",
-                (u_id, datetime.utcnow().isoformat(), note))
-    conn.commit()
-
-def save_plan(u_id: int, item: str):
-    cur.execute("INSERT INTO plans (user_id, ts, item) VALUES (?,?,?)",
-                (u_id, datetime.utcnow().isoformat(), item))
-    conn.commit()
-
-def aggregate(u_id: int, days: int):
-    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
-    rows = cur.execute("SELECT stress, sleep_hours, triggers FROM checkins WHERE user_id=? AND ts>=?",
-                       (u_id, since)).fetchall()
-    if not rows:
+        u = {"user_id": row[0], "lang": row[1], "country": row[2]}
+    else:
+        await db.write(("INSERT OR IGNORE INTO users (user_id, lang, country, created_at) VALUES (?,?,?,?)",
+                        (u_id, DEFAULT_LANG, DEFAULT_COUNTRY, datetime.utcnow().isoformat())))
+        u = {"user_id": u_id, "lang": DEFAULT_LANG, "country": DEFAULT_COUNTRY}
+    profiles.put(u_id, u)
+    return u
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "set_lang"),))
+async def set_lang(u_id: int, lang: str):
+    await db.write(("UPDATE users SET lang=? WHERE user_id=?", (lang, u_id)))
+    profiles.update(u_id, lang=lang)
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "set_country"),))
+async def set_country(u_id: int, country: str):
+    await db.write(("UPDATE users SET country=? WHERE user_id=?", (country, u_id)))
+    profiles.update(u_id, country=country)
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "save_checkin"),))
+async def save_checkin(u_id: int, stress, triggers, sleep_hours, micro_goal):
+    ts = datetime.utcnow().isoformat()
+    c_id = await db.write(
+        ("INSERT INTO checkins (user_id, ts, stress, triggers, sleep_hours, micro_goal) "
+         "VALUES (?,?,?,?,?,?)",
+         (u_id, ts, stress, triggers, sleep_hours, micro_goal)),
+        ("INSERT INTO daily_rollups (user_id, day, n, stress_sum, stress_n, sleep_sum, sleep_n) "
+         "VALUES (?,?,1,?,?,?,?) ON CONFLICT (user_id, day) DO UPDATE SET "
+         "n=n+1, stress_sum=stress_sum+excluded.stress_sum, stress_n=stress_n+excluded.stress_n, "
+         "sleep_sum=sleep_sum+excluded.sleep_sum, sleep_n=sleep_n+excluded.sleep_n",
+         (u_id, ts[:10], stress or 0.0, int(stress is not None), sleep_hours or 0.0, int(sleep_hours is not None))),
+        *term_stmts(u_id, ts[:10], triggers),
+    )
+    charts.invalidate(u_id)
+    return c_id
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "save_trigger"),))
+async def save_trigger(u_id: int, note: str):
+    ts = datetime.utcnow().isoformat()
+    await db.write(("INSERT INTO triggers (user_id, ts, note) VALUES (?,?,?)", (u_id, ts, note)),
+                   *term_stmts(u_id, ts[:10], note))
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "save_plan"),))
+async def save_plan(u_id: int, item: str):
+    await db.write(("INSERT INTO plans (user_id, ts, item) VALUES (?,?,?)",
+                    (u_id, datetime.utcnow().isoformat(), item)))
+
+@metrics.timed("svitlo_db_call_seconds", (("fn", "aggregate"),))
+async def aggregate(u_id: int, days: int):
+    # window = today plus the previous days-1 UTC days, i.e. at most `days` rollup rows
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    row = await db.fetchone("SELECT total(n), total(stress_sum), total(stress_n), total(sleep_sum), total(sleep_n) "
+                            "FROM daily_rollups WHERE user_id=? AND day>=?", (u_id, since))
+    n, stress_sum, stress_n, sleep_sum, sleep_n = row
+    if not n:
         return None
-    stresses = [r[0] for r in rows if r[0] is not None]
-    sleeps = [r[1] for r in rows if r[1] is not None]
-    all_tr = " ".join([(r[2] or "") for r in rows])
-    words = re.findall(r"[A-Za-zА-Яа-яЇїІіЄєҐґ']{3,}", all_tr.lower())
-    from collections import Counter
-    top = ", ".join([w for w, _ in Counter(words).most_common(5)]) or "—"
+    rows = await db.fetchall("SELECT term, sum(n) AS c FROM trigger_terms WHERE user_id=? AND day>=? "
+                             "GROUP BY term ORDER BY c DESC, term LIMIT 5", (u_id, since))
+    top = ", ".join([r[0] for r in rows]) or "—"
     return {
-        "avg": (sum(stresses) / len(stresses)) if stresses else 0.0,
-        "sleep": (sum(sleeps) / len(sleeps)) if sleeps else 0.0,
-        "n": len(rows),
+        "avg": (stress_sum / stress_n) if stress_n else 0.0,
+        "sleep": (sleep_sum / sleep_n) if sleep_n else 0.0,
+        "n": int(n),
         "top": top
     }
 
+# ---------- PERSISTENCE ----------
+class SqlitePersistence(BasePersistence):
+    # user_data and ConversationHandler states in svitlo.sqlite3, so a redeploy resumes
+    # half-finished flows. PTB buffers changes and calls update_* every update_interval
+    # seconds and once more on stop; each such flush lands in one writer transaction.
+    def __init__(self, update_interval: float = PERSIST_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True,
+                                                     callback_data=False), update_interval=update_interval)
+
+    async def get_user_data(self):
+        await db.open()  # Application.initialize() loads persistence before post_init runs
+        return {u_id: json.loads(data) for u_id, data in await db.fetchall("SELECT user_id, data FROM user_state")}
+
+    async def get_conversations(self, name: str):
+        await db.open()
+        rows = await db.fetchall("SELECT key, state FROM conv_state WHERE name=?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_user_data(self, user_id: int, data: dict):
+        await db.write(("INSERT OR REPLACE INTO user_state (user_id, data) VALUES (?,?)", (user_id, json.dumps(data))))
+
+    async def drop_user_data(self, user_id: int):
+        await db.write(("DELETE FROM user_state WHERE user_id=?", (user_id,)))
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        if new_state is None:
+            await db.write(("DELETE FROM conv_state WHERE name=? AND key=?", (name, json.dumps(key))))
+        else:
+            await db.write(("INSERT OR REPLACE INTO conv_state (name, key, state) VALUES (?,?,?)",
+                            (name, json.dumps(key), json.dumps(new_state))))
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        pass  # every update_* call has already been committed by the writer
+
 # ---------- CRISIS FILTER ----------
-SUICIDE = re.compile(
-    r"\b(kill myself|suicide|end it|self[- ]?harm|cut myself|want to die|не хочу жити|суїцид|покінчити|зарізатись|"
-    r"вкоротити|самопошкодження)\b", re.I)
+CRISIS_PHRASES = [
+    "kill myself", "suicide", "end it", "self harm", "selfharm", "cut myself", "want to die",
+    "не хочу жити", "суїцид", "покінчити", "зарізатись", "вкоротити", "самопошкодження",
+]
+
+# normalization is a handful of C-level regex passes; Python only runs for the rare chars that change
+_FOLD = {"’": "'", "ʼ": "'", "`": "'", "´": "'", "ї": "і", "ё": "е", "ґ": "г"}  # + invisible chars -> ""
+_CHARS = re.compile("[\u00ad\u200b\u200c\u200d\u2060\ufeff’ʼ`´їёґ]")
+_SEPARATORS = re.compile(r"[\s\-‐‑‒–—_]{2,}|[^\S ]|[\-‐‑‒–—_]")
+_HOMOGLYPHS = str.maketrans("aceiopxy", "асеіорху")  # latin look-alikes next to Cyrillic letters
+_MIXED = re.compile(r"(?<=[а-яіїєґ])[aceiopxy]+|[aceiopxy]+(?=[а-яіїєґ])")
+
+def normalize(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "").casefold()
+    t = _CHARS.sub(lambda m: _FOLD.get(m.group(0), ""), t)
+    t = _SEPARATORS.sub(" ", t)
+    return _MIXED.sub(lambda m: m.group(0).translate(_HOMOGLYPHS), t)
+
+def compile_phrases(phrases) -> re.Pattern:
+    # phrases go into a trie emitted as one prefix-factored regex, so each position
+    # costs at most one walk down the trie however long the list grows
+    trie = {}
+    for p in phrases:
+        node = trie
+        for ch in normalize(p).strip():
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        alts = [re.escape(ch) + emit(node[ch]) for ch in sorted(k for k in node if k)]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return re.compile(r"\b" + emit(trie) + r"\b")
+
+def load_phrases() -> list:
+    phrases = list(CRISIS_PHRASES)
+    if CRISIS_PHRASES_FILE:
+        with open(CRISIS_PHRASES_FILE, encoding="utf-8") as f:
+            phrases += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return phrases
+
+CRISIS = compile_phrases(load_phrases())
+
+def is_crisis(text: str) -> bool:
+    return CRISIS.search(normalize(text)) is not None
+
+# ---------- LLM ----------
+SYSTEM_PROMPT = ("You are Svitlo AI, a mental health *training* assistant for veterans. "
+                 "Not a medical or crisis service. Avoid diagnosis/medications/politics/religion/graphic content. "
+                 "Keep it short and practical. If self-harm is mentioned -> refuse + show helplines.")
+
+def count_tokens(messages: list) -> int:
+    # estimate without a tokenizer: ~4 UTF-8 bytes per token (so ~2 Cyrillic letters), +4 per message
+    return sum(len(m["content"].encode()) // 4 + 4 for m in messages)
+
+class LLM:
+    # One AsyncOpenAI client (shared connection pool) for the whole process.
+    # complete() returns None instead of raising so callers fall back to T(lang, "unknown").
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, queue: int = LLM_QUEUE, timeout: float = LLM_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.client = None
+        self.pending = 0  # in flight + waiting for a slot
+        self.stats = Counter()
+        self.tokens = Counter()  # estimated prompt/completion tokens actually sent
+        self.max_prompt = 0
+        self._sem = asyncio.Semaphore(concurrency)
+
+    def _count(self, messages: list):
+        n = count_tokens(messages)
+        self.tokens["prompt"] += n
+        self.max_prompt = max(self.max_prompt, n)
+
+    async def open(self, api_key: str = OPENAI_KEY, base_url: str = OPENAI_BASE_URL):
+        if not api_key:
+            return
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        import httpx
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url, timeout=self.timeout, max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=self.concurrency, max_keepalive_connections=self.concurrency)),
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def complete(self, messages: list, **kwargs):
+        if self.client is None:
+            return None
+        if self.pending >= self.concurrency + self.queue:
+            self.stats["shed"] += 1
+            return None
+        self.pending += 1
+        t0 = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._call(messages, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeout"] += 1
+        except Exception:
+            self.stats["error"] += 1
+            log.warning("chat completion failed", exc_info=True)
+        finally:
+            self.pending -= 1
+            metrics.observe("svitlo_llm_seconds", time.perf_counter() - t0, (("mode", "blocking"),))
+        return None
+
+    async def _call(self, messages: list, **kwargs):
+        async with self._sem:
+            self._count(messages)  # counted once sent: a call timed out in the queue sends nothing
+            resp = await self.client.chat.completions.create(
+                model=OPENAI_MODEL, messages=messages,
+                **{"temperature": 0.4, "max_tokens": 300, **kwargs})
+        self.stats["ok"] += 1
+        text = (resp.choices[0].message.content or "").strip()
+        self.tokens["completion"] += count_tokens([{"content": text}])
+        return text
+
+    async def stream(self, messages: list, **kwargs):
+        # same limits as complete(); yields text deltas, stops quietly on shed/timeout/error
+        if self.client is None:
+            return
+        if self.pending >= self.concurrency + self.queue:
+            self.stats["shed"] += 1
+            return
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.timeout
+        self.pending += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            self.pending -= 1
+            self.stats["timeout"] += 1
+            return
+        self._count(messages)
+        resp, first, out = None, True, 0
+        try:
+            resp = await asyncio.wait_for(self.client.chat.completions.create(
+                model=OPENAI_MODEL, messages=messages, stream=True,
+                **{"temperature": 0.4, "max_tokens": 300, **kwargs}), deadline - loop.time())
+            chunks = resp.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        metrics.observe("svitlo_llm_first_token_seconds", loop.time() - start)
+                    out += len(chunk.choices[0].delta.content.encode())
+                    yield chunk.choices[0].delta.content
+            self.stats["ok"] += 1
+        except asyncio.TimeoutError:
+            self.stats["timeout"] += 1
+        except Exception:
+            self.stats["error"] += 1
+            log.warning("chat stream failed", exc_info=True)
+        finally:
+            if resp is not None:
+                await resp.close()
+            self._sem.release()
+            self.pending -= 1
+            self.tokens["completion"] += out // 4
+            metrics.observe("svitlo_llm_seconds", loop.time() - start, (("mode", "stream"),))
+
+llm = LLM()
+metrics.collectors.append(lambda: [("svitlo_llm_calls_total", "counter", (("result", k),), v)
+                                   for k, v in llm.stats.items()] +
+                                  [("svitlo_llm_tokens_total", "counter", (("kind", k),), v)
+                                   for k, v in llm.tokens.items()] +
+                                  [("svitlo_llm_pending", "gauge", (), llm.pending)])
+
+# ---------- BROADCAST / REMINDERS ----------
+class TokenBucket:
+    # global send budget shared by every fan-out; waiters are served FIFO, so concurrent
+    # broadcasts and reminder runs interleave fairly
+    def __init__(self, rate: float = BROADCAST_RATE, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def take(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+bucket = TokenBucket()
+fanout_tasks = set()
+broadcasts_running = set()
+
+async def fanout_send(bot, chat_id: int, text: str, kind: str) -> bool:
+    for _ in range(3):
+        await bucket.take()
+        try:
+            await bot.send_message(chat_id, text)
+            metrics.inc("svitlo_fanout_sent_total", (("kind", kind),))
+            return True
+        except RetryAfter as e:
+            # Telegram asks everyone to back off, not just this chat: stall the whole bucket
+            metrics.inc("svitlo_fanout_retry_after_total", (("kind", kind),))
+            bucket.pause(e.retry_after)
+        except (Forbidden, BadRequest):
+            break  # blocked the bot / chat gone
+        except TelegramError as e:
+            log.warning("%s to %s failed: %s", kind, chat_id, e)
+            break
+    metrics.inc("svitlo_fanout_failed_total", (("kind", kind),))
+    return False
+
+def spawn(coro, tasks: set = fanout_tasks):
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+async def start_broadcast(text: str) -> tuple:
+    b_id = await db.write(("INSERT INTO broadcasts (text, created_at, cursor, sent, failed) VALUES (?,?,0,0,0)",
+                           (text, datetime.utcnow().isoformat())))
+    n = (await db.fetchone("SELECT count(*) FROM users"))[0]
+    return b_id, n
+
+async def run_broadcast(bot, b_id: int):
+    # walks users in user_id order; `cursor` is checkpointed after every send so a restart
+    # resumes right after the last user who got the message
+    text, cursor = await db.fetchone("SELECT text, cursor FROM broadcasts WHERE id=?", (b_id,))
+    while True:
+        rows = await db.fetchall("SELECT user_id FROM users WHERE user_id>? ORDER BY user_id LIMIT 500", (cursor,))
+        if not rows:
+            break
+        for (u_id,) in rows:
+            ok = await fanout_send(bot, u_id, text, "broadcast")
+            cursor = u_id
+            await db.write(("UPDATE broadcasts SET cursor=?, sent=sent+?, failed=failed+? WHERE id=?",
+                            (cursor, int(ok), int(not ok), b_id)))
+    await db.write(("UPDATE broadcasts SET done_at=? WHERE id=?", (datetime.utcnow().isoformat(), b_id)))
+
+async def resume_broadcasts(bot):
+    # every unfinished broadcast not already running here (new ones, or cut off by a restart)
+    for (b_id,) in await db.fetchall("SELECT id FROM broadcasts WHERE done_at IS NULL ORDER BY id"):
+        if b_id not in broadcasts_running:
+            broadcasts_running.add(b_id)
+            spawn(run_broadcast(bot, b_id)).add_done_callback(lambda _, b_id=b_id: broadcasts_running.discard(b_id))
+
+async def set_reminder(u_id: int, hhmm, now: datetime = None):
+    # a time already past today starts tomorrow: today counts as reminded, otherwise the next
+    # tick would treat it as missed and send it right away
+    now = now or datetime.utcnow()
+    done = now.date().isoformat() if hhmm and hhmm < now.strftime("%H:%M") else None
+    await db.write(("UPDATE users SET remind_at=?, reminded_on=? WHERE user_id=?", (hhmm, done, u_id)))
+
+async def run_reminders(bot, now: datetime = None):
+    # due = reminder time already passed today and not yet sent today, so reminders missed
+    # while the bot was down still go out; reminded_on is the per-user checkpoint
+    now = now or datetime.utcnow()
+    today, hhmm = now.date().isoformat(), now.strftime("%H:%M")
+    rows = await db.fetchall("SELECT user_id, lang FROM users WHERE remind_at IS NOT NULL AND remind_at<=? "
+                             "AND (reminded_on IS NULL OR reminded_on<?) ORDER BY user_id", (hhmm, today))
+    for u_id, lang in rows:
+        await fanout_send(bot, u_id, T(lang, "reminder"), "reminder")
+        await db.write(("UPDATE users SET reminded_on=? WHERE user_id=?", (today, u_id)))
+
+async def remind_tick(context: ContextTypes.DEFAULT_TYPE):
+    await resume_broadcasts(context.bot)  # picks up /broadcast sent to other workers
+    if not context.bot_data.get("reminders_running"):
+        context.bot_data["reminders_running"] = True
+        task = spawn(run_reminders(context.bot))
+        task.add_done_callback(lambda _: context.bot_data.pop("reminders_running", None))
+
+# ---------- EXPORT ----------
+# one UNION ALL over the three history tables: a single cursor and a single WAL snapshot,
+# flattened into one column set (cells that do not apply to a table stay empty)
+EXPORT_COLUMNS = ("table", "id", "user_id", "ts", "stress", "triggers", "sleep_hours", "micro_goal", "note", "item")
+EXPORT_SELECT = {
+    "checkins": "SELECT 'checkins', id, user_id, ts, stress, triggers, sleep_hours, micro_goal, NULL, NULL FROM checkins",
+    "triggers": "SELECT 'triggers', id, user_id, ts, NULL, NULL, NULL, NULL, note, NULL FROM triggers",
+    "plans": "SELECT 'plans', id, user_id, ts, NULL, NULL, NULL, NULL, NULL, item FROM plans",
+}
+EXPORT_SQL = " UNION ALL ".join(sql + "{w}" for sql in EXPORT_SELECT.values())
+# lowest id still in each table: anything below it was archived by compact() (an id prefix)
+EXPORT_LIVE_IDS = "SELECT " + ", ".join(f"(SELECT min(id) FROM {t})" for t in EXPORT_SELECT)
+
+def _export_chunk(gz, rows, fmt: str):
+    # runs in a worker thread: encoding + deflate are the CPU-heavy part of an export
+    buf = io.StringIO()
+    if fmt == "csv":
+        csv.writer(buf).writerows(rows)
+    else:
+        for r in rows:
+            buf.write(json.dumps({k: v for k, v in zip(EXPORT_COLUMNS, r) if v is not None}, ensure_ascii=False))
+            buf.write("\n")
+    gz.write(buf.getvalue().encode())
+
+def _archived(u_id, live: dict):
+    # rows compact() moved to the archive, oldest month first, as export tuples; one user's
+    # export reads only that user's chunks (indexed). Rows at or above a table's lowest live id
+    # are still in the export's DB snapshot (a compaction ran meanwhile, or crashed before its
+    # DELETE), as are repeats of a re-archived slice: both are skipped.
+    conn = _archive_db(create=False)
+    if conn is None:
+        return
+    with contextlib.closing(conn):
+        sql, params = ("SELECT month, data FROM chunks ORDER BY month, rowid", ()) if u_id is None else \
+            ("SELECT month, data FROM chunks WHERE user_id=? ORDER BY month, rowid", (u_id,))
+        month, seen = None, set()
+        for m, data in conn.execute(sql, params):
+            if m != month:
+                month, seen = m, set()
+            for line in gzip.decompress(data).decode().splitlines():
+                r = json.loads(line)
+                key = (r["table"], r["id"])
+                if key in seen or r["id"] >= (live.get(r["table"]) or float("inf")):
+                    continue
+                seen.add(key)
+                yield tuple(r.get(c) for c in EXPORT_COLUMNS)
+
+def _archive_page(gz, rows, fmt: str) -> int:
+    # worker thread: the next page of _archived() into the export
+    page = list(itertools.islice(rows, EXPORT_PAGE))
+    if page:
+        _export_chunk(gz, page, fmt)
+    return len(page)
+
+@metrics.timed("svitlo_export_seconds")
+async def export_file(u_id, fmt: str = "csv"):
+    # u_id=None exports everyone; returns (gzip temp file rewound to 0, row count).
+    # Archived history comes first, then the live tables.
+    sql, params = (EXPORT_SQL.format(w=""), ()) if u_id is None else (EXPORT_SQL.format(w=" WHERE user_id=?"), (u_id,) * 3)
+    f = tempfile.TemporaryFile()
+    n = 0
+    with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+        if fmt == "csv":
+            await asyncio.to_thread(_export_chunk, gz, [EXPORT_COLUMNS], fmt)
+        async with contextlib.aclosing(db.stream(sql, params, head=(EXPORT_LIVE_IDS,))) as pages:
+            archived = _archived(u_id, dict(zip(EXPORT_SELECT, (await anext(pages))[0])))
+            while k := await asyncio.to_thread(_archive_page, gz, archived, fmt):
+                n += k
+            async for rows in pages:
+                await asyncio.to_thread(_export_chunk, gz, rows, fmt)
+                n += len(rows)
+    f.seek(0)
+    metrics.inc("svitlo_export_rows_total", value=n)
+    return f, n
+
+export_tasks = set()
+exports_running = set()
+
+def start_export(bot, chat_id: int, u_id, fmt: str, lang: str) -> bool:
+    # exports run beside the update handlers, never inside one (they take seconds to minutes);
+    # one at a time per requester. False if this one is already running.
+    key = (chat_id, u_id)
+    if key in exports_running:
+        return False
+    exports_running.add(key)
+    spawn(send_export(bot, chat_id, u_id, fmt, lang), export_tasks).add_done_callback(
+        lambda _: exports_running.discard(key))
+    return True
+
+async def send_export(bot, chat_id: int, u_id, fmt: str, lang: str):
+    try:
+        await _send_export(bot, chat_id, u_id, fmt, lang)
+    except Exception:
+        metrics.inc("svitlo_errors_total", (("where", "export"),))
+        log.exception("export for %s failed", u_id or "all")
+
+async def _send_export(bot, chat_id: int, u_id, fmt: str, lang: str):
+    f, n = await export_file(u_id, fmt)
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        if not n:
+            await bot.send_message(chat_id, T(lang, "export_empty"))
+        elif size > EXPORT_MAX_BYTES:
+            await bot.send_message(chat_id, T(lang, "export_too_big"))
+        else:
+            name = f"svitlo-{u_id or 'all'}-{datetime.utcnow():%Y%m%d}.{fmt}.gz"
+            await bot.send_document(chat_id, document=f, filename=name, caption=T(lang, "export_ready").format(n=n))
+
+# ---------- MAINTENANCE ----------
+# rows older than RETENTION_DAYS move to ARCHIVE_DIR/archive.sqlite3: gzip'd chunks of /export
+# jsonl lines, one per (user, month) per slice, indexed by user. daily_rollups and trigger_terms
+# are never touched, so /report keeps its history, and /export reads the archive back
+# (_archived), so it does too. Work is sliced so the shared writer is only ever held for one
+# small step. The archive is plain sqlite3, used from worker threads only.
+ARCHIVE_DB = os.path.join(ARCHIVE_DIR, "archive.sqlite3")
+ARCHIVE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS chunks (user_id INTEGER NOT NULL, month TEXT NOT NULL, data BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_chunks_user ON chunks (user_id, month)",
+    "CREATE INDEX IF NOT EXISTS idx_chunks_month ON chunks (month)",
+]
+
+_legacy_lock = threading.Lock()
+
+def _archive_db(create: bool = True):
+    # None if there is nothing archived yet and create is False. Monthly svitlo-YYYY-MM.jsonl.gz
+    # files written before the archive was a database are folded in once and renamed *.imported.
+    legacy = sorted(glob.glob(os.path.join(ARCHIVE_DIR, "svitlo-*.jsonl.gz")))
+    if not (create or legacy or os.path.exists(ARCHIVE_DB)):
+        return None
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    conn = sqlite3.connect(ARCHIVE_DB, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # a chunk is on disk before its rows are deleted
+    for sql in ARCHIVE_SCHEMA:
+        conn.execute(sql)
+    with _legacy_lock:
+        for path in legacy:
+            if not os.path.exists(path):
+                continue  # another thread imported it meanwhile
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                lines = (json.loads(line) for line in f)
+                while page := list(itertools.islice(lines, COMPACT_BATCH)):
+                    _put_chunks(conn, [tuple(r.get(c) for c in EXPORT_COLUMNS) for r in page])
+            os.replace(path, path + ".imported")
+    return conn
+
+def _put_chunks(conn, rows):
+    chunks = {}
+    for r in rows:
+        chunks.setdefault((r[2], r[3][:7]), []).append(r)
+    values = []
+    for (u_id, month), chunk in chunks.items():
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as gz:
+            _export_chunk(gz, chunk, "jsonl")
+        values.append((u_id, month, buf.getvalue()))
+    with conn:
+        conn.executemany("INSERT INTO chunks (user_id, month, data) VALUES (?,?,?)", values)
+
+def _archive(rows):
+    # committed before the rows are deleted. A crash between the two re-archives that slice
+    # next run: readers dedupe on (table, id).
+    with contextlib.closing(_archive_db()) as conn:
+        _put_chunks(conn, rows)
+
+async def _db_bytes() -> int:
+    (pages,), (size,) = await db.fetchone("PRAGMA page_count"), await db.fetchone("PRAGMA page_size")
+    return pages * size
+
+async def compact(now: datetime = None) -> dict:
+    horizon = ((now or datetime.utcnow()) - timedelta(days=RETENTION_DAYS)).isoformat()
+    before = await _db_bytes()
+    # files created before auto_vacuum=INCREMENTAL was the default can only switch through one
+    # full VACUUM: done here, after the first archiving run, so only RETENTION_DAYS users pay it
+    incremental = (await db.fetchone("PRAGMA auto_vacuum"))[0] == 2
+    moved = Counter()
+    for table, select in EXPORT_SELECT.items():
+        while True:
+            # ids are AUTOINCREMENT and ts is stamped at insert, so old rows are an id prefix:
+            # each slice reads from the start of the table and stops at the first recent row
+            rows = await db.fetchall(f"{select} ORDER BY id LIMIT ?", (COMPACT_BATCH,))
+            old = list(itertools.takewhile(lambda r: r[3] < horizon, rows))
+            if not old:
+                break
+            await asyncio.to_thread(_archive, old)
+            await db.write((f"DELETE FROM {table} WHERE id<=?", (old[-1][1],)))
+            if incremental:
+                await db.maintain(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+            moved[table] += len(old)
+            if len(old) < len(rows):
+                break
+    if not incremental:
+        log.info("compaction: switching %s to auto_vacuum=INCREMENTAL (one full VACUUM)", db.path)
+        await db.maintain("PRAGMA auto_vacuum=INCREMENTAL; VACUUM")
+    else:
+        # writers keep freeing pages meanwhile: release what is free now, in bounded steps,
+        # and leave the rest to the next run
+        free = (await db.fetchone("PRAGMA freelist_count"))[0]
+        for _ in range(-(-free // VACUUM_PAGES) + 1):
+            if not (await db.fetchone("PRAGMA freelist_count"))[0]:
+                break
+            await db.maintain(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        else:
+            left = (await db.fetchone("PRAGMA freelist_count"))[0]
+            if left:
+                log.warning("compaction: %d pages still free, left for the next run", left)
+    await db.maintain("PRAGMA wal_checkpoint(PASSIVE); PRAGMA optimize")
+    reclaimed = before - await _db_bytes()
+    for table, n in moved.items():
+        metrics.inc("svitlo_compacted_rows_total", (("table", table),), n)
+    metrics.inc("svitlo_compaction_reclaimed_bytes_total", value=max(0, reclaimed))
+    log.info("compaction before %s: archived %s, reclaimed %d bytes", horizon, dict(moved), reclaimed)
+    return {"archived": dict(moved), "reclaimed": reclaimed}
+
+async def maintenance_tick(context: ContextTypes.DEFAULT_TYPE):
+    if not context.bot_data.get("compaction_running"):
+        context.bot_data["compaction_running"] = True
+        task = spawn(compact())
+        task.add_done_callback(lambda _: context.bot_data.pop("compaction_running", None))
+
+# ---------- CHAT BURSTS / QUOTAS ----------
+class ChatQuota:
+    # one completion per coalesced prompt: a per-user bucket (LRU-capped; an evicted user just
+    # starts full again) and one global bucket in front of the paid API
+    def __init__(self, user_rate: float = CHAT_USER_RATE / 60, user_burst: float = CHAT_USER_BURST,
+                 global_rate: float = CHAT_GLOBAL_RATE / SHARDS, size: int = 10000):
+        self.user_rate, self.user_burst, self.size = user_rate, user_burst, size
+        self.all = TokenBucket(global_rate)
+        self.users = OrderedDict()
+
+    def check(self, u_id: int):
+        # None if allowed, else the TEXT key to answer with
+        b = self.users.pop(u_id, None) or TokenBucket(self.user_rate, self.user_burst)
+        self.users[u_id] = b
+        if len(self.users) > self.size:
+            self.users.popitem(last=False)
+        if not b.try_take():
+            metrics.inc("svitlo_chat_limited_total", (("scope", "user"),))
+            return "slow_down"
+        if not self.all.try_take():
+            b.tokens += 1  # not this user's fault
+            metrics.inc("svitlo_chat_limited_total", (("scope", "global"),))
+            return "busy"
+        return None
+
+quota = ChatQuota()
+
+class Coalescer:
+    # Lines a user sends within `window` of each other (at most `max_wait` after the first)
+    # become one prompt. chat() only buffers, so the per-user update lock is released at once:
+    # crisis lines and commands never queue behind a pending completion. Unlike broadcasts
+    # these lines are not checkpointed anywhere, so close() answers them all before shutdown.
+    def __init__(self, window: float = CHAT_DEBOUNCE, max_wait: float = CHAT_DEBOUNCE_MAX):
+        self.window, self.max_wait = window, max_wait
+        self.tasks = set()
+        self._pending = {}  # user_id -> open burst
+        self._last = {}     # user_id -> task of the newest burst, so answers keep their order
+
+    def add(self, u_id: int, update: Update):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        b = self._pending.get(u_id)
+        if b is None:
+            b = self._pending[u_id] = {"texts": [], "first": now, "wake": loop.create_future()}
+            b["task"] = spawn(self._flush(u_id, b, self._last.get(u_id)), self.tasks)
+            self._last[u_id] = b["task"]
+            b["task"].add_done_callback(lambda t: self._last.pop(u_id) if self._last.get(u_id) is t else None)
+        else:
+            metrics.inc("svitlo_chat_coalesced_total")
+        b["texts"].append(update.message.text or "")
+        b["last"], b["update"] = now, update
+
+    def drop(self, u_id: int):
+        b = self._pending.pop(u_id, None)
+        if b:
+            b["task"].cancel()
+
+    async def close(self):
+        # no new lines arrive any more: answer every open burst now, and wait for all answers
+        for b in self._pending.values():
+            if not b["wake"].done():
+                b["wake"].set_result(None)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _flush(self, u_id: int, b: dict, prev):
+        loop = asyncio.get_running_loop()
+        while (delay := min(b["last"] + self.window, b["first"] + self.max_wait) - loop.time()) > 0:
+            if b["wake"].done():
+                break
+            await asyncio.wait([b["wake"]], timeout=delay)
+        if self._pending.get(u_id) is b:
+            del self._pending[u_id]
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            await answer(b["update"], "\n".join(b["texts"]))
+        except Exception:
+            metrics.inc("svitlo_errors_total", (("where", "chat"),))
+            log.exception("chat reply failed")
+
+bursts = Coalescer()
+
+# ---------- CHAT MEMORY ----------
+# per user: the last CHAT_MEMORY_TURNS messages verbatim plus a rolling summary of everything
+# older. The summary is only rewritten when the window overflows, folding the older half in one
+# call, and the prompt is cut to CHAT_TOKEN_BUDGET newest-first, however long the history gets.
+SUMMARY_PROMPT = ("Update the running summary of a support chat with the new messages. Keep what matters for "
+                  "later replies: the user's situation, stressors, what helped, open threads. No advice. "
+                  "Under {words} words. Reply with the summary only.")
+
+async def load_memory(u_id: int) -> dict:
+    row = await db.fetchone("SELECT summary, turns FROM chat_memory WHERE user_id=?", (u_id,))
+    return {"summary": row[0] or "", "turns": json.loads(row[1])} if row else {"summary": "", "turns": []}
+
+async def checkin_digest(u_id: int) -> str:
+    agg = await aggregate(u_id, 7)
+    if not agg:
+        return ""
+    return (f"User's check-ins, last 7 days: {agg['n']}, average stress {agg['avg']:.1f}/10, "
+            f"sleep {agg['sleep']:.1f} h, frequent triggers: {agg['top']}.")
+
+def build_prompt(mem: dict, text: str, digest: str = "") -> list:
+    head = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if digest:
+        head.append({"role": "system", "content": digest})
+    if mem["summary"]:
+        head.append({"role": "system", "content": "Earlier in this conversation: " + mem["summary"]})
+    user = {"role": "user", "content": text[:2000]}
+    budget = CHAT_TOKEN_BUDGET - count_tokens(head + [user])
+    kept = []
+    for role, content in reversed(mem["turns"]):
+        budget -= count_tokens([{"content": content}])
+        if budget < 0:
+            break
+        kept.append({"role": role, "content": content})
+    return head + kept[::-1] + [user]
+
+async def summarize(summary: str, turns: list) -> str:
+    metrics.inc("svitlo_chat_summaries_total")
+    transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+    out = await llm.complete([
+        {"role": "system", "content": SUMMARY_PROMPT.format(words=CHAT_SUMMARY_TOKENS * 3 // 4)},
+        {"role": "user", "content": f"Summary so far: {summary or '(none)'}\n\nNew messages:\n{transcript}"},
+    ], max_tokens=CHAT_SUMMARY_TOKENS, temperature=0)
+    if out:
+        return out
+    # no LLM right now: keep the user's own lines, clipped to roughly the same size
+    lines = " / ".join([summary] + [content for role, content in turns if role == "user"])
+    return lines.strip(" /")[-CHAT_SUMMARY_TOKENS * 4:]
+
+async def remember(u_id: int, mem: dict, text: str, reply: str):
+    turns = mem["turns"] + [["user", text[:2000]], ["assistant", reply]]
+    summary = mem["summary"]
+    if len(turns) > CHAT_MEMORY_TURNS:
+        cut = len(turns) - CHAT_MEMORY_TURNS // 2
+        summary = await summarize(summary, turns[:cut])
+        turns = turns[cut:]
+    await db.write(("INSERT INTO chat_memory (user_id, summary, turns) VALUES (?,?,?) ON CONFLICT (user_id) "
+                    "DO UPDATE SET summary=excluded.summary, turns=excluded.turns",
+                    (u_id, summary, json.dumps(turns, ensure_ascii=False))))
+
+# ---------- CHARTS ----------
+def _chart_warmup():
+    import matplotlib.figure  # noqa: F401  (first import is the slow part)
+
+def render_chart(rows: list, since: str, days: int, labels: tuple) -> bytes:
+    # runs in a worker process; rows = (day, avg stress | None, avg sleep | None) from daily_rollups
+    from matplotlib.figure import Figure
+    by_day = {r[0]: r for r in rows}
+    start = datetime.fromisoformat(since).date()
+    xs = [start + timedelta(days=d) for d in range(days)]
+    nan = float("nan")
+    stress = [by_day.get(x.isoformat(), (None, None, None))[1] for x in xs]
+    sleep = [by_day.get(x.isoformat(), (None, None, None))[2] for x in xs]
+    fig = Figure(figsize=(6, 3.2), dpi=100)
+    ax = fig.subplots()
+    ax.plot(xs, [nan if v is None else v for v in stress], "o-", color="#d9534f")
+    ax.set_ylim(0, 10)
+    ax.set_ylabel(labels[0], color="#d9534f")
+    ax2 = ax.twinx()
+    ax2.plot(xs, [nan if v is None else v for v in sleep], "s--", color="#4a6fd0")
+    ax2.set_ylim(0, 12)
+    ax2.set_ylabel(labels[1], color="#4a6fd0")
+    ax.set_title(labels[2])
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+class Charts:
+    # /report trend PNGs, rendered in a process pool (never on the event loop). Once Telegram
+    # has a chart, only its file_id is kept, keyed by (user, days) and tagged with what the image
+    # shows: last check-in id, first day of the window and label language. save_checkin drops
+    # the user's entries; a stale tag (new day, new check-in, /lang switch) is a miss as well.
+    def __init__(self, workers: int = CHART_WORKERS, size: int = CHART_CACHE_SIZE, backlog: int = CHART_BACKLOG):
+        self.workers = workers
+        self.size = size
+        self.backlog = backlog
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+        self.skipped = 0
+        self._ids = OrderedDict()
+
+    def open(self):
+        if self.pool is None and self.workers > 0:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self.pool.submit(_chart_warmup)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def get(self, u_id: int, days: int, tag: tuple):
+        item = self._ids.get((u_id, days))
+        if item is None or item[0] != tag:
+            self.misses += 1
+            return None
+        self._ids.move_to_end((u_id, days))
+        self.hits += 1
+        return item[1]
+
+    def put(self, u_id: int, days: int, tag: tuple, file_id: str):
+        self._ids[(u_id, days)] = (tag, file_id)
+        self._ids.move_to_end((u_id, days))
+        while len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+
+    def invalidate(self, u_id: int):
+        for days in (7, 30):
+            self._ids.pop((u_id, days), None)
+
+    async def render(self, *args):
+        # None once `backlog` renders are queued: the text report is out already, and a chart
+        # that arrives minutes late is worse than none
+        if self.pending >= self.backlog:
+            self.skipped += 1
+            return None
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, render_chart, *args)
+        finally:
+            self.pending -= 1
+
+charts = Charts()
+chart_tasks = set()
+metrics.collectors.append(lambda: [
+    ("svitlo_chart_cache_hits_total", "counter", (), charts.hits),
+    ("svitlo_chart_cache_misses_total", "counter", (), charts.misses),
+    ("svitlo_chart_skipped_total", "counter", (), charts.skipped),
+    ("svitlo_chart_pending", "gauge", (), charts.pending),
+])
 
 # ---------- STATES ----------
 DAILY_STRESS, DAILY_TRIGGERS, DAILY_SLEEP, DAILY_GOAL = range(4)
 BREATH_GO, GROUND_GO, PLAN_GO, TRIG_GO = range(4)  # dummy placeholders for convs
 
 # ---------- HANDLERS ----------
+async def crisis_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # group -1: sees every text message once, new or edited, before commands and conversations.
+    # Edits are only screened: no later handler answers (or re-runs a step for) an edited line.
+    msg = update.effective_message
+    if is_crisis(msg.text):
+        metrics.inc("svitlo_crisis_hits_total")
+        bursts.drop(update.effective_user.id)  # no small-talk answer after the crisis reply
+        u = await get_user(update.effective_user.id)
+        await msg.reply_text(T(u["lang"], "crisis"))
+        raise ApplicationHandlerStop
+    if update.edited_message is not None:
+        raise ApplicationHandlerStop
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     kb = InlineKeyboardMarkup(
         [[InlineKeyboardButton("EN", callback_data="lang_en"),
           InlineKeyboardButton("UK", callback_data="lang_uk")]]
@@ -189,43 +1533,39 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     data = q.data
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     if data.startswith("lang_"):
         lang = data.split("_", 1)[1]
         if lang in ("en", "uk"):
-            set_lang(u["user_id"], lang)
+            await set_lang(u["user_id"], lang)
             await q.answer("OK")
             await q.edit_message_text(T(lang, "saved") + f" Language={lang.upper()}")
             return
     await q.answer("OK")
 
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(
         T(u["lang"], "settings").format(lang=u["lang"], country=u["country"]),
         parse_mode=ParseMode.MARKDOWN
     )
 
 async def wildcard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     txt = update.message.text.strip().lower()
     if txt.startswith("lang "):
         lang = txt.split()[-1]
         if lang in ("en", "uk"):
-            set_lang(u["user_id"], lang)
+            await set_lang(u["user_id"], lang)
             await update.message.reply_text(T(lang, "saved"))
     elif txt.startswith("country "):
         c = txt.split()[-1].upper()
         if c in ("US", "UA"):
-            set_country(u["user_id"], c)
+            await set_country(u["user_id"], c)
             await update.message.reply_text(T(u["lang"], "saved"))
 
 async def daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if SUICIDE.search(update.message.text or ""):
-        u = get_user(update.effective_user.id)
-        await update.message.reply_text(T(u["lang"], "crisis"))
-        return ConversationHandler.END
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "checkin_intro"))
     return DAILY_STRESS
 
@@ -237,13 +1577,13 @@ async def daily_stress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("0–10")
         return DAILY_STRESS
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "checkin_stress_saved").format(val=context.user_data["s"]))
     return DAILY_TRIGGERS
 
 async def daily_triggers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["tr"] = update.message.text.strip()
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "checkin_triggers_saved"))
     return DAILY_SLEEP
 
@@ -253,20 +1593,20 @@ async def daily_sleep(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("e.g., 6.5")
         return DAILY_SLEEP
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "checkin_sleep_saved"))
     return DAILY_GOAL
 
 async def daily_goal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     g = update.message.text.strip()
-    u = get_user(update.effective_user.id)
-    save_checkin(u["user_id"], context.user_data.get("s"), context.user_data.get("tr", ""),
-                 context.user_data.get("sl"), g)
+    u = await get_user(update.effective_user.id)
+    await save_checkin(u["user_id"], context.user_data.get("s"), context.user_data.get("tr", ""),
+                       context.user_data.get("sl"), g)
     await update.message.reply_text(T(u["lang"], "checkin_done"))
     return ConversationHandler.END
 
 async def breath(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "breath_intro"), parse_mode=ParseMode.MARKDOWN)
     return BREATH_GO
 
@@ -274,18 +1614,18 @@ async def breath_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text.strip().lower() != "go":
         await update.message.reply_text("Type 'go'")
         return BREATH_GO
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "breath_go"))
     return ConversationHandler.END
 
 async def ground(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     context.user_data["g_step"] = 0
     await update.message.reply_text(T(u["lang"], "ground_intro"))
     return GROUND_GO
 
 async def ground_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     steps_en = [
         ("5 things you see", "around you"),
         ("4 things you feel", "touch/textures"),
@@ -311,11 +1651,11 @@ async def ground_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return GROUND_GO
 
 async def sleep_tips(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "sleep_tips"))
 
 async def plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     context.user_data["plan"] = []
     await update.message.reply_text(T(u["lang"], "plan_intro"), parse_mode=ParseMode.MARKDOWN)
     return PLAN_GO
@@ -323,9 +1663,9 @@ async def plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def plan_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     txt = update.message.text.strip()
     if txt.lower() == "done":
-        u = get_user(update.effective_user.id)
+        u = await get_user(update.effective_user.id)
         for it in context.user_data.get("plan", [])[:3]:
-            save_plan(u["user_id"], it)
+            await save_plan(u["user_id"], it)
         await update.message.reply_text(T(u["lang"], "plan_saved"))
         return ConversationHandler.END
     context.user_data.setdefault("plan", []).append(txt)
@@ -333,23 +1673,59 @@ async def plan_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PLAN_GO
 
 async def trig(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "triggers_intro"), parse_mode=ParseMode.MARKDOWN)
     return TRIG_GO
 
 async def trig_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     txt = update.message.text.strip()
     if txt.lower() == "done":
-        u = get_user(update.effective_user.id)
+        u = await get_user(update.effective_user.id)
         await update.message.reply_text(T(u["lang"], "saved"))
         return ConversationHandler.END
-    u = get_user(update.effective_user.id)
-    save_trigger(u["user_id"], txt)
+    u = await get_user(update.effective_user.id)
+    await save_trigger(u["user_id"], txt)
     await update.message.reply_text("Logged.")
     return TRIG_GO
 
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMINS:
+        return
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("/broadcast <text>")
+        return
+    b_id, n = await start_broadcast(text)
+    if LEADER:  # otherwise the leader starts it on its next tick
+        await resume_broadcasts(context.bot)
+    await update.message.reply_text(f"Broadcast #{b_id} queued for {n} users.")
+
+async def remind(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    u = await get_user(update.effective_user.id)
+    arg = (context.args or [""])[0].lower()
+    if arg == "off":
+        await set_reminder(u["user_id"], None)
+        await update.message.reply_text(T(u["lang"], "remind_off"))
+        return
+    try:
+        hhmm = datetime.strptime(arg, "%H:%M").strftime("%H:%M")
+    except ValueError:
+        await update.message.reply_text(T(u["lang"], "remind_usage"), parse_mode=ParseMode.MARKDOWN)
+        return
+    await set_reminder(u["user_id"], hhmm)
+    await update.message.reply_text(T(u["lang"], "remind_set").format(hhmm=hhmm))
+
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /export [csv|jsonl]; admins: /export all [csv|jsonl]. Built in the background either way.
+    u = await get_user(update.effective_user.id)
+    args = [a.lower() for a in context.args or []]
+    fmt = "jsonl" if "jsonl" in args else "csv"
+    everyone = "all" in args and u["user_id"] in ADMINS
+    if not start_export(context.bot, update.effective_chat.id, None if everyone else u["user_id"], fmt, u["lang"]):
+        await update.message.reply_text(T(u["lang"], "export_running"))
+
 async def report(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     await update.message.reply_text(T(u["lang"], "report_intro"))
 
 async def report_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -359,8 +1735,8 @@ async def report_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("Reply 7 or 30.")
         return
-    u = get_user(update.effective_user.id)
-    agg = aggregate(u["user_id"], days)
+    u = await get_user(update.effective_user.id)
+    agg = await aggregate(u["user_id"], days)
     if not agg:
         await update.message.reply_text("No data yet.")
         return
@@ -368,45 +1744,210 @@ async def report_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
         T(u["lang"], "report_ready").format(days=days, avg=agg["avg"],
                                             n=agg["n"], sleep=agg["sleep"], trg=agg["top"])
     )
+    if charts.pool is not None:  # after the text, outside the handler slot
+        spawn(send_chart(update, u, days), chart_tasks)
+
+async def send_chart(update: Update, u: dict, days: int):
+    try:
+        await _send_chart(update, u, days)
+    except Exception:
+        metrics.inc("svitlo_errors_total", (("where", "chart"),))
+        log.warning("chart for %s failed", u["user_id"], exc_info=True)
+
+async def _send_chart(update: Update, u: dict, days: int):
+    last_id = (await db.fetchone("SELECT max(id) FROM checkins WHERE user_id=?", (u["user_id"],)))[0] or 0
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    tag = (last_id, since, u["lang"])
+    file_id = charts.get(u["user_id"], days, tag)
+    if file_id:
+        try:
+            await update.message.reply_photo(file_id)
+            return
+        except BadRequest:
+            pass  # file_id no longer valid: render again
+    rows = await db.fetchall("SELECT day, CASE WHEN stress_n THEN stress_sum / stress_n END, "
+                             "CASE WHEN sleep_n THEN sleep_sum / sleep_n END FROM daily_rollups "
+                             "WHERE user_id=? AND day>=? ORDER BY day", (u["user_id"], since))
+    labels = (T(u["lang"], "chart_stress"), T(u["lang"], "chart_sleep"), T(u["lang"], "chart_title").format(days=days))
+    png = await charts.render(rows, since, days, labels)
+    if png is None:
+        return
+    msg = await update.message.reply_photo(png)
+    charts.put(u["user_id"], days, tag, msg.photo[-1].file_id)
 
 async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text or ""
-    u = get_user(update.effective_user.id)
-    if SUICIDE.search(text):
-        await update.message.reply_text(T(u["lang"], "crisis"))
+    if CHAT_DEBOUNCE > 0 and llm.client is not None:
+        bursts.add(update.effective_user.id, update)
         return
-    if not OPENAI_KEY:
+    await answer(update, update.message.text or "")
+
+async def answer(update: Update, text: str):
+    u = await get_user(update.effective_user.id)
+    if llm.client is None:  # no model: nothing to ration, and the prompt would be thrown away
         await update.message.reply_text(T(u["lang"], "unknown"))
         return
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_KEY)
-        system = ("You are Svitlo AI, a mental health *training* assistant for veterans. "
-                  "Not a medical or crisis service. Avoid diagnosis/medications/politics/religion/graphic content. "
-                  "Keep it short and practical. If self-harm is mentioned -> refuse + show helplines.")
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": text[:2000]}
-            ],
-            temperature=0.4,
-            max_tokens=300
-        )
-        await update.message.reply_text(resp.choices[0].message.content.strip())
-    except Exception:
-        await update.message.reply_text(T(u["lang"], "unknown"))
+    limited = quota.check(u["user_id"])
+    if limited:
+        await update.message.reply_text(T(u["lang"], limited))
+        return
+    mem = await load_memory(u["user_id"])
+    messages = build_prompt(mem, text, await checkin_digest(u["user_id"]) if CHAT_DIGEST else "")
+    if LLM_STREAM:
+        reply = await stream_reply(update, u["lang"], messages)
+    else:
+        reply = await llm.complete(messages)
+        await update.message.reply_text(reply or T(u["lang"], "unknown"))
+    if reply:  # fallbacks are not part of the conversation
+        await remember(u["user_id"], mem, text, reply)
+
+async def stream_reply(update: Update, lang: str, messages: list):
+    # placeholder first, then edits coalesced to one per LLM_EDIT_INTERVAL, then a final edit;
+    # returns the model's text ("" if it produced none)
+    loop = asyncio.get_running_loop()
+    msg = await update.message.reply_text("…")
+    text, shown, next_edit = "", "…", 0.0
+    async for delta in llm.stream(messages):
+        text += delta
+        if loop.time() >= next_edit and text.strip() and text.strip() != shown:
+            try:
+                await msg.edit_text(text.strip())
+                shown = text.strip()
+                next_edit = loop.time() + LLM_EDIT_INTERVAL
+            except RetryAfter as e:
+                next_edit = loop.time() + e.retry_after
+            except BadRequest:
+                pass
+    final = text.strip() or T(lang, "unknown")
+    for _ in range(2):
+        if final == shown:
+            break
+        try:
+            await msg.edit_text(final)
+            break
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+        except BadRequest:
+            break
+    return text.strip()
+
+async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    metrics.inc("svitlo_errors_total", (("where", "handler"),))
+    log.error("update failed", exc_info=context.error)
+
+def instrument(app: Application):
+    # wrap every callback (conversation states included) with a latency histogram
+    def timed(callback):
+        return metrics.timed("svitlo_handler_seconds", (("handler", callback.__name__),))(callback)
+
+    def walk(handlers):
+        for h in handlers:
+            if isinstance(h, ConversationHandler):
+                walk(h.entry_points)
+                for state_handlers in h.states.values():
+                    walk(state_handlers)
+                walk(h.fallbacks)
+            else:
+                h.callback = timed(h.callback)
+
+    for group in app.handlers.values():
+        walk(group)
 
-def build_app() -> Application:
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+async def on_startup(app: Application):
+    await db.open()
+    await llm.open()
+    charts.open()
+    if LEADER:
+        await resume_broadcasts(app.bot)
+    if app.job_queue is not None and LEADER:
+        app.job_queue.run_repeating(remind_tick, interval=REMIND_INTERVAL, first=1.0, name="reminders")
+        if RETENTION_DAYS > 0:
+            app.job_queue.run_repeating(maintenance_tick, interval=MAINTENANCE_INTERVAL, first=60.0, name="compaction")
+    if metrics.enabled:
+        app.bot_data["lag_task"] = asyncio.create_task(watch_loop_lag())
+        if BOT_MODE != "webhook" and METRICS_PORT:
+            app.bot_data["metrics_server"] = tornado.web.Application(
+                [("/metrics", MetricsHandler)]).listen(METRICS_PORT)
+
+async def on_stop(app: Application):
+    # updates have stopped but the bot can still send: buffered chat lines were already
+    # accepted, so they get their answers (post_shutdown runs after bot.shutdown()); the same
+    # goes for exports and charts already being built
+    await bursts.close()
+    await asyncio.gather(*export_tasks, *chart_tasks, return_exceptions=True)
+
+async def on_shutdown(app: Application):
+    if app.bot_data.get("metrics_server"):
+        app.bot_data.pop("metrics_server").stop()
+    if app.bot_data.get("lag_task"):
+        app.bot_data.pop("lag_task").cancel()
+    for task in list(fanout_tasks):  # progress is checkpointed; resumed on next start
+        task.cancel()
+    await asyncio.gather(*fanout_tasks, return_exceptions=True)
+    charts.close()
+    await llm.close()
+    await db.close()
+
+class PerUserOrder(BaseUpdateProcessor):
+    # Different users are processed concurrently, one user's updates strictly in arrival
+    # order (ConversationHandler steps must not overtake each other). The base class holds its
+    # semaphore across do_process_update, waits for the user's lock included, so one user's
+    # backlog could fill every slot; it is left unbounded and the real limit is taken only
+    # around the handler run, by the update at the head of its user's queue. Updates reach the
+    # per-user lock in arrival order (tasks start FIFO and an open semaphore never suspends).
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        who = (update.effective_user or update.effective_chat) if isinstance(update, Update) else None
+        if who is None:
+            async with self._slots:
+                await coroutine
+            return
+        key = who.id
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def build_app(request: BaseRequest = None) -> Application:
+    builder = (ApplicationBuilder().token(BOT_TOKEN).post_init(on_startup)
+               .post_stop(on_stop).post_shutdown(on_shutdown))
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserOrder(CONCURRENT_UPDATES))
+    if request is not None:
+        builder = builder.request(request)
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+    if PERSIST_INTERVAL > 0:
+        builder = builder.persistence(SqlitePersistence())
+    app = builder.build()
+
+    app.add_handler(MessageHandler(filters.UpdateType.MESSAGES & filters.TEXT, crisis_gate), group=-1)
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CallbackQueryHandler(cb))
 
     app.add_handler(CommandHandler("settings", settings))
     app.add_handler(CommandHandler("sleep", sleep_tips))
+    app.add_handler(CommandHandler("remind", remind))
+    app.add_handler(CommandHandler("export", export))
+    app.add_handler(CommandHandler("broadcast", broadcast))
 
     app.add_handler(ConversationHandler(
+        name="daily", persistent=PERSIST_INTERVAL > 0,
         entry_points=[CommandHandler("daily", daily)],
         states={
             DAILY_STRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, daily_stress)],
@@ -418,24 +1959,28 @@ def build_app() -> Application:
     ))
 
     app.add_handler(ConversationHandler(
+        name="breath", persistent=PERSIST_INTERVAL > 0,
         entry_points=[CommandHandler("breath", breath)],
         states={BREATH_GO: [MessageHandler(filters.TEXT & ~filters.COMMAND, breath_flow)]},
         fallbacks=[]
     ))
 
     app.add_handler(ConversationHandler(
+        name="ground", persistent=PERSIST_INTERVAL > 0,
         entry_points=[CommandHandler("ground", ground)],
         states={GROUND_GO: [MessageHandler(filters.TEXT & ~filters.COMMAND, ground_flow)]},
         fallbacks=[]
     ))
 
     app.add_handler(ConversationHandler(
+        name="plan", persistent=PERSIST_INTERVAL > 0,
         entry_points=[CommandHandler("plan", plan)],
         states={PLAN_GO: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_flow)]},
         fallbacks=[]
     ))
 
     app.add_handler(ConversationHandler(
+        name="triggers", persistent=PERSIST_INTERVAL > 0,
         entry_points=[CommandHandler("triggers", trig)],
         states={TRIG_GO: [MessageHandler(filters.TEXT & ~filters.COMMAND, trig_flow)]},
         fallbacks=[]
@@ -443,15 +1988,274 @@ def build_app() -> Application:
 
     app.add_handler(CommandHandler("report", report))
     app.add_handler(MessageHandler(filters.Regex(r"^(7|30)$"), report_value))
-    app.add_handler(MessageHandler(filters.Regex(r"^(lang\s+(en|uk)|country\s+(US|UA))$", re.I), wildcard))
+    app.add_handler(MessageHandler(filters.Regex(re.compile(r"^(lang\s+(en|uk)|country\s+(US|UA))$", re.I)), wildcard))
 
     # Fallback чат с OpenAI/подсказками
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, chat))
 
+    app.add_error_handler(on_error)
+    if metrics.enabled:
+        instrument(app)
+
     return app
 
+# ---------- WEBHOOK ----------
+class WebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, app: Application):
+        self.app = app
+
+    async def post(self):
+        if WEBHOOK_SECRET and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            self.set_status(403)
+            return
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.app.bot)
+        except Exception:
+            self.set_status(400)
+            return
+        await self.app.update_queue.put(update)
+        self.set_status(200)
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, app: Application):
+        self.app = app
+
+    def get(self):
+        ok = self.app.running and db.alive
+        self.set_status(200 if ok else 503)
+        self.write({"ok": ok, "queued": self.app.update_queue.qsize()})
+
+class MetricsHandler(tornado.web.RequestHandler):
+    async def get(self):
+        if METRICS_TOKEN and self.request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            self.set_status(401)
+            return
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(await self.render())
+
+    async def render(self) -> str:
+        return metrics.render()
+
+def webhook_server(app: Application) -> tornado.web.Application:
+    routes = [
+        (WEBHOOK_PATH, WebhookHandler, {"app": app}),
+        ("/healthz", HealthHandler, {"app": app}),
+    ]
+    if metrics.enabled:
+        routes.append(("/metrics", MetricsHandler))
+    return tornado.web.Application(routes)
+
+async def run_webhook(app: Application, port: int = PORT, url: str = WEBHOOK_URL, stop: asyncio.Event = None):
+    # run_webhook() from PTB has no room for extra routes, so we drive the Application ourselves
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError, RuntimeError):
+            loop.add_signal_handler(sig, stop.set)
+    server = webhook_server(app).listen(port, address="127.0.0.1" if WORKER_INDEX >= 0 else "")
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if url:
+        await app.bot.set_webhook(url + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+                                  allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    await app.start()
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        await app.stop()  # also flushes persistence one last time
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+# ---------- SUPERVISOR ----------
+def update_user_id(data: dict):
+    # the user (else chat) PerUserOrder would key on, read from the raw update JSON
+    for value in data.values():
+        if isinstance(value, dict):
+            who = value.get("from") or value.get("user") or value.get("chat") or (value.get("message") or {}).get("chat")
+            if who:
+                return who.get("id")
+    return None
+
+class FrontHandler(tornado.web.RequestHandler):
+    def initialize(self, front):
+        self.front = front
+
+    async def post(self):
+        if WEBHOOK_SECRET and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            self.set_status(403)
+            return
+        try:
+            data = json.loads(self.request.body)
+            key = update_user_id(data) or data["update_id"]
+        except Exception:
+            self.set_status(400)
+            return
+        self.set_status(await self.front.forward(key, self.request.body))
+
+class FrontHealthHandler(tornado.web.RequestHandler):
+    def initialize(self, front):
+        self.front = front
+
+    def get(self):
+        alive = [p is not None and p.poll() is None for p in self.front.procs]
+        self.set_status(200 if all(alive) else 503)
+        self.write({"ok": all(alive), "workers": alive, "inflight": self.front.inflight})
+
+class FrontMetricsHandler(MetricsHandler):
+    def initialize(self, front):
+        self.front = front
+
+    async def render(self) -> str:
+        return await self.front.scrape()
+
+def merge_metrics(text: str, families: dict, worker: str = None):
+    # one process's exposition into families (name -> TYPE line + samples), worker="..." added
+    # to every sample if given; grouping by family keeps the merged text valid Prometheus format
+    fam = None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            fam = families.setdefault(line.split()[2], [line])
+        elif line and not line.startswith("#") and fam is not None and worker is None:
+            fam.append(line)
+        elif line and not line.startswith("#") and fam is not None:
+            name = line.split(" ", 1)[0].split("{", 1)[0]
+            rest = line[len(name):]
+            fam.append(f'{name}{{worker="{worker}"' + (f",{rest[1:]}" if rest.startswith("{") else f"}}{rest}"))
+
+class Supervisor:
+    # WORKERS > 1 in webhook mode: N copies of this file run as workers on 127.0.0.1, worker i
+    # owning the users with user_id % N == i, so conversation state, per-user ordering and the
+    # in-process caches stay local to one process while all of them share svitlo.sqlite3 (WAL).
+    # The front parses each update in full (json.loads, ~10 us; a scan of the raw body could hit
+    # a nested "from" and split a user) only to pick the worker, then relays the raw body. Worker
+    # 0 is the leader (reminders, broadcasts, compaction). Worker /metrics stay on localhost; the
+    # front's /metrics scrapes them all and serves one merged page, labelled by worker.
+    def __init__(self, n: int = WORKERS, port: int = PORT, worker_port: int = WORKER_PORT):
+        self.n = n
+        self.port = port
+        self.ports = [worker_port + i for i in range(n)]
+        self.procs = [None] * n
+        self.inflight = 0
+        self.stopping = False
+        self.client = tornado.httpclient.AsyncHTTPClient(max_clients=CONCURRENT_UPDATES * n)
+
+    def spawn(self, i: int):
+        env = {**os.environ, "WORKER_INDEX": str(i), "PORT": str(self.ports[i]),
+               "WEBHOOK_URL": "", "RENDER_EXTERNAL_URL": ""}  # only the front registers the webhook
+        self.procs[i] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    async def forward(self, key: int, body: bytes) -> int:
+        i = key % self.n
+        self.inflight += 1
+        try:
+            code = (await self.client.fetch(
+                f"http://127.0.0.1:{self.ports[i]}{WEBHOOK_PATH}", method="POST", body=body, raise_error=False,
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET})).code
+        except (OSError, tornado.httpclient.HTTPClientError):
+            # worker down, restarting or timed out (raise_error=False still raises on 599):
+            # Telegram redelivers on non-2xx
+            code = 503
+        finally:
+            self.inflight -= 1
+        metrics.inc("svitlo_front_updates_total", (("worker", str(i)), ("code", str(code))))
+        return 503 if code == 599 else code
+
+    async def scrape(self) -> str:
+        headers = {"Authorization": f"Bearer {METRICS_TOKEN}"} if METRICS_TOKEN else {}
+
+        async def one(i: int):
+            with contextlib.suppress(OSError, tornado.httpclient.HTTPClientError):
+                r = await self.client.fetch(f"http://127.0.0.1:{self.ports[i]}/metrics", headers=headers,
+                                            request_timeout=5)
+                return r.body.decode()
+            return None
+
+        texts = await asyncio.gather(*(one(i) for i in range(self.n)))
+        families = {}
+        merge_metrics(metrics.render(), families)  # the front's own (its worker label is the target)
+        for i, text in enumerate(texts):
+            if text is not None:
+                merge_metrics(text, families, str(i))
+        families["svitlo_worker_up"] = ["# TYPE svitlo_worker_up gauge"] + [
+            f'svitlo_worker_up{{worker="{i}"}} {int(text is not None)}' for i, text in enumerate(texts)]
+        return "\n".join(itertools.chain.from_iterable(families.values())) + "\n"
+
+    async def wait_healthy(self, i: int, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.procs[i].poll() is not None:
+                raise RuntimeError(f"worker {i} exited with {self.procs[i].returncode}")
+            with contextlib.suppress(OSError, tornado.httpclient.HTTPClientError):
+                if (await self.client.fetch(f"http://127.0.0.1:{self.ports[i]}/healthz", raise_error=False)).code == 200:
+                    return
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"worker {i} not healthy after {timeout}s")
+
+    async def watch(self):
+        while not self.stopping:
+            for i, p in enumerate(self.procs):
+                if p.poll() is not None and not self.stopping:
+                    log.warning("worker %d exited with %s, restarting", i, p.returncode)
+                    self.spawn(i)
+            await asyncio.sleep(1)
+
+    async def run(self, stop: asyncio.Event = None):
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(sig, stop.set)
+        await db.open()  # migrate once here, so workers never race on the schema
+        await db.close()
+        server = watcher = None
+        for i in range(self.n):
+            self.spawn(i)
+        try:
+            await asyncio.gather(*(self.wait_healthy(i) for i in range(self.n)))
+            routes = [(WEBHOOK_PATH, FrontHandler, {"front": self}), ("/healthz", FrontHealthHandler, {"front": self})]
+            if metrics.enabled:
+                routes.append(("/metrics", FrontMetricsHandler, {"front": self}))
+            server = tornado.web.Application(routes).listen(self.port)
+            if WEBHOOK_URL:
+                async with Bot(BOT_TOKEN, **({"base_url": f"{BOT_API_URL}/bot"} if BOT_API_URL else {})) as bot:
+                    await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+                                          allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+            watcher = asyncio.create_task(self.watch())
+            log.info("front on :%d, %d workers on %s", self.port, self.n, self.ports)
+            await stop.wait()
+        finally:
+            # drain: refuse new updates (Telegram redelivers them to the next deploy), let relayed
+            # ones land, then SIGTERM workers; each finishes its queue and flushes persistence
+            self.stopping = True
+            if server is not None:
+                server.stop()
+            if watcher is not None:
+                watcher.cancel()
+            while self.inflight:
+                await asyncio.sleep(0.05)
+            for p in self.procs:
+                if p.poll() is None:
+                    p.terminate()
+            for i, p in enumerate(self.procs):
+                try:
+                    await asyncio.to_thread(p.wait, DRAIN_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    log.warning("worker %d did not drain in %ss, killing", i, DRAIN_TIMEOUT)
+                    p.kill()
+
 
 if __name__ == "__main__":
-    application = build_app()
-    # ВАЖНО: без asyncio.run — это синхронный блокирующий вызов (fix event loop error)
-    application.run_polling(drop_pending_updates=True)
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s", level=logging.INFO)
+    if BOT_MODE == "webhook" and WORKERS > 1 and WORKER_INDEX < 0:
+        asyncio.run(Supervisor().run())
+    elif BOT_MODE == "webhook":
+        asyncio.run(run_webhook(build_app()))
+    else:
+        application = build_app()
+        # ВАЖНО: без asyncio.run — это синхронный блокирующий вызов (fix event loop error)
+        application.run_polling(drop_pending_updates=True)